@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Post-processing script for VASP output
+
+Band gap summary of many runs (e.g. strain or doping series): every
+directory holding a vasprun.xml under the given roots is a run. Only the
+k-points, eigenvalues and Fermi level are read (vasprunReader.ReadEigenvalues,
+the <projected> block is never parsed), on a pool of processes, one task
+per run; a failing run is reported and does not stop the others.
+
+For each run: band gap, VBM and CBM energies and k-points (fractional), the
+direct/indirect flag, the smallest direct gap and the Fermi level. As in
+pymatgen's get_band_gap, the VBM is the highest eigenvalue below the Fermi
+level and the CBM the lowest above it, both spins together, and a band
+crossing the Fermi level makes the run a metal (gap 0). The direct gap is,
+as in get_direct_band_gap, the smallest gap at one k-point within one spin.
+
+The summary of each run is cached in CACHE_FILE inside its directory with
+the size, mtime and SHA-1 of its vasprun.xml, so a new scan only reads the
+new or changed runs (-f reads them all). The table is written as
+<output>.json and <output>.csv.
+
+Usage: bandGapSummary.py [-n <processes>] [-o <output>] [-f] <dir> [<dir> ...]'''
+
+import sys, getopt
+import csv
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from fileCache import FileRecord, IsFresh, ReadJSON, WriteJSON
+from instrumentation import MergeStages, TakeStages
+from vasprunReader import ReadEigenvalues
+
+CACHE_FILE = '.bandgap.json'
+# Bumped whenever the summary changes, so that older cache entries are read again
+CACHE_VERSION = 2
+METAL_TOLERANCE = 1e-4
+COLUMNS = ('directory', 'efermi', 'gap', 'direct', 'metal', 'direct_gap',
+    'vbm', 'cbm', 'vbm_kpoint', 'cbm_kpoint', 'error')
+
+def FindRuns ( roots ):
+    '''Directories holding a vasprun.xml under roots, sorted; hidden
+    directories (caches) are not entered'''
+    runs = set()
+    for root in roots:
+        for directory, subdirectories, files in os.walk( root ):
+            subdirectories[:] = [name for name in subdirectories if not name.startswith( '.' )]
+            if 'vasprun.xml' in files:
+                runs.add( os.path.normpath( directory ) )
+    return sorted( runs )
+
+def BandGap ( eigenvalues, kpoints, efermi, tolerance=METAL_TOLERANCE ):
+    '''Gap summary of eigenvalues (spin, kpoint, band) around efermi'''
+    lowest = eigenvalues.min( axis=1 )
+    highest = eigenvalues.max( axis=1 )
+    metal = bool( np.any( (lowest < efermi - tolerance) & (highest > efermi + tolerance) ) )
+    below = np.where( eigenvalues <= efermi, eigenvalues, -np.inf )
+    above = np.where( eigenvalues > efermi, eigenvalues, np.inf )
+    # highest occupied and lowest unoccupied level of each spin and k-point
+    top_spin = below.max( axis=2 )
+    bottom_spin = above.min( axis=2 )
+    top = top_spin.max( axis=0 )
+    bottom = bottom_spin.min( axis=0 )
+    vbm_k, cbm_k = int( np.argmax( top ) ), int( np.argmin( bottom ) )
+    summary = {
+        'efermi': efermi,
+        'metal': metal,
+        'vbm': float( top[vbm_k] ),
+        'cbm': float( bottom[cbm_k] ),
+        'vbm_kpoint': kpoints[vbm_k].tolist(),
+        'cbm_kpoint': kpoints[cbm_k].tolist(),
+    }
+    if metal or not np.isfinite( top[vbm_k] ) or not np.isfinite( bottom[cbm_k] ):
+        summary.update( gap=0.0, direct=False, direct_gap=0.0 )
+    else:
+        # the same k-point can appear twice (line mode segment ends)
+        summary.update( gap=summary['cbm'] - summary['vbm'],
+            direct=bool( np.allclose( kpoints[vbm_k], kpoints[cbm_k] ) ),
+            direct_gap=float( np.min( bottom_spin - top_spin ) ) )
+    return summary
+
+def CachedSummary ( directory ):
+    '''Summary cached for directory, or None if missing or stale'''
+    cached = ReadJSON( os.path.join( directory, CACHE_FILE ) )
+    if (cached is None or cached.get( 'version' ) != CACHE_VERSION
+            or not IsFresh( os.path.join( directory, 'vasprun.xml' ), cached.get( 'vasprun' ) )):
+        return None
+    return cached['summary']
+
+def SummarizeRun ( directory ):
+    '''Pool task: never raises, the error is returned in the summary'''
+    start = time.time()
+    TakeStages()
+    summary = {'directory': directory, 'error': None}
+    try:
+        vasprun_path = os.path.join( directory, 'vasprun.xml' )
+        record = FileRecord( vasprun_path )
+        run = ReadEigenvalues( vasprun_path )
+        summary.update( BandGap( run['eigenvalues'], run['kpoints'], run['efermi'] ) )
+        WriteJSON( os.path.join( directory, CACHE_FILE ), {'version': CACHE_VERSION, 'vasprun': record, 'summary': summary} )
+    except Exception:
+        summary['error'] = traceback.format_exc()
+    summary['seconds'] = time.time() - start
+    summary['stages'] = TakeStages()
+    return summary
+
+def SummarizeRuns ( directories, processes=None, force=False ):
+    '''Summaries of directories, in order, reading only the uncached runs'''
+    summaries = {}
+    if not force:
+        for directory in directories:
+            cached = CachedSummary( directory )
+            if cached is not None:
+                summaries[directory] = cached
+    pending = [directory for directory in directories if directory not in summaries]
+    print( "{} runs, {} cached, {} to read".format( len( directories ), len( summaries ), len( pending ) ) )
+    if pending:
+        with ProcessPoolExecutor( max_workers=processes ) as pool:
+            futures = {pool.submit( SummarizeRun, directory ): directory for directory in pending}
+            for done, future in enumerate( as_completed( futures ), start=1 ):
+                summary = future.result()
+                MergeStages( summary.pop( 'stages' ) )
+                summaries[futures[future]] = summary
+                status = "failed" if summary['error'] else "gap {:.4f} eV".format( summary['gap'] )
+                print( "[{}/{}] {}: {} ({:.1f} s)".format(
+                    done, len( pending ), summary['directory'], status, summary['seconds'] ) )
+                if summary['error']:
+                    print( summary['error'], file=sys.stderr )
+    return [summaries[directory] for directory in directories]
+
+def WriteSummary ( output_path, summaries ):
+    '''Writes <output_path>.json and <output_path>.csv'''
+    WriteJSON( output_path + '.json', {'runs': summaries} )
+    with open( output_path + '.csv', 'w', newline='' ) as output:
+        writer = csv.DictWriter( output, COLUMNS, extrasaction='ignore' )
+        writer.writeheader()
+        for summary in summaries:
+            row = dict( summary )
+            for key in ( 'vbm_kpoint', 'cbm_kpoint' ):
+                if row.get( key ) is not None:
+                    row[key] = " ".join( "{:.6f}".format( value ) for value in row[key] )
+            if row['error']:
+                # the traceback is in the JSON file
+                row['error'] = row['error'].strip().splitlines()[-1]
+            writer.writerow( row )
+
+def main( argv ):
+    usage = "bandGapSummary.py -n <processes> -o <output> -f <dir> [<dir> ...]"
+    try:
+        opts, args = getopt.getopt( argv, "hn:o:f", ["processes=", "out=", "force"] )
+    except getopt.GetoptError:
+        print( usage )
+        sys.exit(2)
+
+    processes = None
+    output_path = 'bandgap_summary'
+    force = False
+    for opt, arg in opts:
+        if opt == "-h":
+            print( usage )
+            sys.exit()
+        elif opt in ( "-n", "--processes" ):
+            processes = int( arg )
+        elif opt in ( "-o", "--out" ):
+            output_path = arg
+        elif opt in ( "-f", "--force" ):
+            force = True
+
+    summaries = SummarizeRuns( FindRuns( args or ['.'] ), processes, force )
+    WriteSummary( output_path, summaries )
+    failed = [summary['directory'] for summary in summaries if summary['error']]
+    print( "summary written on files {0}.json and {0}.csv ({1} of {2} runs failed)".format( output_path, len( failed ), len( summaries ) ) )
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Persistent binary cache of the band structure parsed by pymatgen
+
+The first call parses vasprun.xml with BSVasprun, without the projected
+eigenvalues, builds the BandStructure (BandStructureSymmLine for line mode
+KPOINTS) and stores its arrays inside CACHE_DIR, next to the vasprun.xml:
+the eigenvalues and k-points in bands.npz and the rest (Fermi level,
+labels, reciprocal lattice, structure) in bands.json together with the size,
+mtime and SHA-1 of vasprun.xml and KPOINTS. Later calls rebuild the
+BandStructure from the arrays in a fraction of the parse time. It serves
+pymatgen_bandstructure_info.py and pymatgen_1bz.py.
+
+The projections are not stored here: the projected band plots
+(pymatgen_bandstructure_plot.py, projectedBandPlot.py) read them with
+projectedReader.py, which streams the <projected> block without pymatgen into
+its own <name>.proj store, eigenvalues included. A run used for both is
+therefore parsed once into each store.
+
+Usage: bandstructureCache.py [-i <vasprun.xml>] [-k <KPOINTS>]'''
+
+import sys, getopt
+import os
+import numpy as np
+from pymatgen import Lattice, Spin, Structure
+from pymatgen.electronic_structure.bandstructure import BandStructure, BandStructureSymmLine
+from pymatgen.io.vasp.outputs import BSVasprun
+from fileCache import FileRecord, IsFresh, ReadJSON, WriteJSON
+
+CACHE_DIR = '.bs_cache'
+
+def CachePaths ( vasprun_path ):
+    cache_dir = os.path.join( os.path.dirname( os.path.abspath( vasprun_path ) ), CACHE_DIR )
+    return cache_dir, os.path.join( cache_dir, 'bands.npz' ), os.path.join( cache_dir, 'bands.json' )
+
+def BuildCache ( vasprun_path, kpoints_path, line_mode=False, verbose=True ):
+    '''Parses the run once, stores its band structure and returns it'''
+    cache_dir, array_path, meta_path = CachePaths( vasprun_path )
+    os.makedirs( cache_dir, exist_ok=True )
+    records = {'vasprun': FileRecord( vasprun_path ), 'kpoints': FileRecord( kpoints_path )}
+    if verbose:
+        print( "parsing {} into {}".format( vasprun_path, cache_dir ) )
+    run = BSVasprun( vasprun_path, parse_projected_eigen=False )
+    bs = run.get_band_structure( kpoints_path, line_mode=line_mode )
+
+    spins = sorted( bs.bands, key=lambda spin: -spin.value )
+    temporary = array_path + '.tmp.npz'
+    np.savez( temporary,
+        kpoints=np.array( [kpoint.frac_coords for kpoint in bs.kpoints] ),
+        **{'bands_{}'.format( spin.value ): bs.bands[spin] for spin in spins} )
+    os.replace( temporary, array_path )
+    WriteJSON( meta_path, dict( records,
+        spins=[spin.value for spin in spins],
+        line_mode=isinstance( bs, BandStructureSymmLine ),
+        efermi=bs.efermi,
+        labels={label: kpoint.frac_coords.tolist() for label, kpoint in bs.labels_dict.items()},
+        lattice_rec=bs.lattice_rec.matrix.tolist(),
+        structure=bs.structure.as_dict() if bs.structure is not None else None ) )
+    return bs
+
+def IsCached ( vasprun_path, kpoints_path ):
+    cache_dir, array_path, meta_path = CachePaths( vasprun_path )
+    meta = ReadJSON( meta_path )
+    return (meta is not None and os.path.exists( array_path )
+        and IsFresh( vasprun_path, meta['vasprun'] ) and IsFresh( kpoints_path, meta['kpoints'] ))
+
+def LoadBandStructure ( vasprun_path='vasprun.xml', kpoints_path='KPOINTS', line_mode=False, verbose=True ):
+    '''Same BandStructure as BSVasprun( vasprun_path ).get_band_structure(
+    kpoints_path, line_mode=line_mode ), without projections, served from the
+    cache'''
+    if not IsCached( vasprun_path, kpoints_path ):
+        return BuildCache( vasprun_path, kpoints_path, line_mode, verbose )
+
+    cache_dir, array_path, meta_path = CachePaths( vasprun_path )
+    meta = ReadJSON( meta_path )
+    spins = [Spin( value ) for value in meta['spins']]
+    with np.load( array_path ) as arrays:
+        kpoints = arrays['kpoints']
+        bands = {spin: arrays['bands_{}'.format( spin.value )] for spin in spins}
+
+    lattice_rec = Lattice( meta['lattice_rec'] )
+    structure = Structure.from_dict( meta['structure'] ) if meta['structure'] else None
+    labels = {label: np.array( coords ) for label, coords in meta['labels'].items()}
+    if meta['line_mode'] or line_mode:
+        return BandStructureSymmLine( kpoints, bands, lattice_rec, meta['efermi'], labels,
+            structure=structure )
+    return BandStructure( kpoints, bands, lattice_rec, meta['efermi'], labels,
+        structure=structure )
+
+def main( argv ):
+    usage = "bandstructureCache.py -i <vasprun.xml> -k <KPOINTS>"
+    try:
+        opts, args = getopt.getopt( argv, "hi:k:", ["in=", "kpoints="] )
+    except getopt.GetoptError:
+        print( usage )
+        sys.exit(2)
+
+    vasprun_path = 'vasprun.xml'
+    kpoints_path = 'KPOINTS'
+    for opt, arg in opts:
+        if opt == "-h":
+            print( usage )
+            sys.exit()
+        elif opt in ( "-i", "--in" ):
+            vasprun_path = arg
+        elif opt in ( "-k", "--kpoints" ):
+            kpoints_path = arg
+
+    LoadBandStructure( vasprun_path, kpoints_path )
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
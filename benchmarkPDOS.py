@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Benchmark of the PDOS pipeline on synthetic vasprun.xml files
+
+For each case a vasprun.xml is written with syntheticVasprun.py and every
+stage of pdosSum.py, pdosSeparated.py, constroiPDOS.py and the pickled
+extractors is timed (wall and CPU) and memory profiled (tracemalloc peak):
+streaming read, cache build and load, ion/orbital selection, broadening,
+saving in both formats and the .dat export, with instrumentation.Stage (the
+stages of the library appear nested under the benchmark ones). Memory
+tracing slows the Python-heavy stages (XML reading) noticeably, so it is
+only enabled with -m.
+
+The .dat exports are checked byte for byte against the original per line
+writer. The outputs are checked against a reference implementation of the original
+scripts (full DOM parse, per row np.fromstring, nditer accumulation and
+per state Gaussian calls). The reference is quadratic in NEDOS and is
+skipped above REFERENCE_LIMIT rows unless -a is given.
+
+Usage: benchmarkPDOS.py [-c <ions>:<ISPIN>:<NEDOS>[:<fields>]] ... [-o <report.json>] [-d <work dir>] [-a] [-m]'''
+
+import sys, getopt
+import os
+import shutil
+import tempfile
+import xml.etree.ElementTree as et
+import numpy as np
+import instrumentation
+import pdosCache
+from broadening import Broaden
+from fileCache import WriteJSON
+from instrumentation import Stage, TakeStages
+from pdosIO import ExportPDOS, LoadPDOS, SavePDOS
+from pdosSelection import OrbitalWeights, SelectPDOS
+from syntheticVasprun import FIELDS, WriteSyntheticVasprun
+from vasprunReader import ReadPartialDOS
+
+DEFAULT_CASES = ['20:2:301', '20:2:301:lm544', '86:2:3001', '200:2:3001']
+# ions*ISPIN*NEDOS above which the reference implementation is skipped
+REFERENCE_LIMIT = 600000
+RTOL = 1e-9
+SIGMA = 0.1
+
+def PrintStages ( stages ):
+    '''One line per benchmark stage, then the self time of the stages of the
+    library, summed over the benchmark stages they ran in'''
+    for name, record in stages.items():
+        if record['nested_in'] is None:
+            line = "    {:<18} {:9.3f} s wall {:9.3f} s cpu".format( name, record['wall'], record['cpu'] )
+            if record['peak_traced_mb'] is not None:
+                line += " {:9.1f} MB peak".format( record['peak_traced_mb'] )
+            print( line )
+    for name, record in stages.items():
+        if record['nested_in'] is not None:
+            line = "      {:<17} {:8.3f} s self wall {:4d} calls".format( name, record['self_wall'], record['calls'] )
+            if record['peak_traced_mb'] is not None:
+                line += " {:9.1f} MB peak".format( record['peak_traced_mb'] )
+            print( line )
+
+def ReferenceDat ( output_path, pdos, eigen_energy, eigen_adjust, pdos_on_y=True ):
+    '''Original per line .dat writer of the pickled extractors, one block per
+    orbital and spin'''
+    if pdos.ndim == 2:
+        pdos = pdos[..., np.newaxis]
+    with open( output_path, 'w' ) as output:
+        for orbital in range( pdos.shape[2] ):
+            for spin, sign in ( (0, 1.0), (0 if pdos.shape[0] == 1 else 1, -1.0) ):
+                for numdos in range( pdos.shape[1] ):
+                    if pdos_on_y:
+                        output.write( "{:f} {:f}\n".format( eigen_energy[numdos] + eigen_adjust, sign*pdos[spin, numdos, orbital] ) )
+                    else:
+                        output.write( "{:f} {:f}\n".format( sign*pdos[spin, numdos, orbital], eigen_energy[numdos] + eigen_adjust ) )
+                output.write( "\n" )
+
+def SameBytes ( first_path, second_path ):
+    with open( first_path, 'rb' ) as first, open( second_path, 'rb' ) as second:
+        return first.read() == second.read()
+
+def ReferencePDOS ( vasprun_path, ion_list, orbitals ):
+    '''Original algorithm of pdosSum.py/pdosSeparated.py, returning the summed
+    and the separated broadened pDOS. The <partial> set lookup is hoisted out
+    of the row loop so that the reference finishes in a sensible time.'''
+    vasprun_root = et.parse( vasprun_path ).getroot()
+    ispin = int( vasprun_root.find( './/*[@name="ISPIN"]' ).text )
+    nedos = int( vasprun_root.find( './/*[@name="NEDOS"]' ).text )
+    partial_set = vasprun_root.find( './/partial/array/set' )
+    pdos_raw = np.empty( (len( ion_list ), ispin, nedos, len( orbitals ) + 1) )
+    for index, ion in enumerate( ion_list ):
+        for spin in range( ispin ):
+            for numdos in range( nedos ):
+                pdos_raw[index, spin, numdos] = np.fromstring( partial_set[ion - 1][spin][numdos].text, sep=' ' )
+    vasprun_root.clear()
+
+    acc = np.zeros( (ispin, nedos, len( orbitals )) )
+    orb_iterator = np.nditer( orbitals, flags=['f_index'] )
+    while not orb_iterator.finished:
+        if orb_iterator.value != 0:
+            for ion in range( len( ion_list ) ):
+                for spin in range( ispin ):
+                    acc[spin, ..., orb_iterator.iterindex] += pdos_raw[ion, spin, :, orb_iterator.iterindex + 1]
+        orb_iterator.iternext()
+
+    eigen_energy = np.linspace( pdos_raw[0, 0, 0, 0], pdos_raw[0, 0, -1, 0], nedos )
+    pdos_sum = acc.sum( axis=-1 )
+    pdos_gaussian = np.zeros( (ispin, nedos) )
+    pdos_separated = np.zeros( (ispin, nedos, len( orbitals )) )
+    for spin in range( ispin ):
+        for numdos in range( nedos ):
+            kernel = np.exp( -0.5*np.power( (eigen_energy - pdos_raw[0, spin, numdos, 0])/SIGMA, 2 ) )
+            pdos_gaussian[spin] += pdos_sum[spin, numdos]*kernel
+            pdos_separated[spin] += acc[spin, numdos][np.newaxis, :]*kernel[:, np.newaxis]
+    return pdos_gaussian, pdos_separated
+
+def RunCase ( case, work_dir, reference=False ):
+    fields = case[3] if len( case ) > 3 else 'lm'
+    ions, ispin, nedos = ( int( value ) for value in case[:3] )
+    norb = len( FIELDS[fields] )
+    print( "case: {} ions, ISPIN={}, NEDOS={}, fields {}".format( ions, ispin, nedos, fields ) )
+    case_dir = os.path.join( work_dir, "{}_{}_{}_{}".format( ions, ispin, nedos, fields ) )
+    os.makedirs( case_dir, exist_ok=True )
+    vasprun_path = os.path.join( case_dir, 'vasprun.xml' )
+    ion_list = np.arange( 1, ions + 1 )
+    orbitals = np.ones( norb )
+    if fields in ( 'lm', 'lm544' ):
+        # the d shell by name, so that both namings of the last d column are exercised
+        orbitals = OrbitalWeights( ['d'], ['energy'] + FIELDS[fields] )
+
+    TakeStages()
+    with Stage( 'generate' ):
+        WriteSyntheticVasprun( vasprun_path, ions, ispin, nedos, fields )
+    with Stage( 'read_stream' ):
+        vasprun = ReadPartialDOS( vasprun_path, ion_list, verbose=False )
+    with Stage( 'cache_build' ):
+        pdosCache.BuildCache( vasprun_path, verbose=False )
+    with Stage( 'cache_read' ):
+        cached = pdosCache.LoadPartialDOS( vasprun_path, ion_list, verbose=False )
+    pdos_raw = vasprun['pdos_raw']
+    energy = pdos_raw[0, 0, :, 0]
+    eigen_energy = np.linspace( energy[0], energy[-1], nedos )
+    with Stage( 'select_sum' ):
+        pdos_sum = SelectPDOS( pdos_raw, orbitals, fields=vasprun['fields'] )
+    with Stage( 'select_separated' ):
+        pdos_separated = SelectPDOS( pdos_raw, orbitals, separated=True, fields=vasprun['fields'] )
+    with Stage( 'broaden_sum' ):
+        gaussian_sum = Broaden( energy, pdos_sum, eigen_energy, SIGMA )
+    with Stage( 'broaden_separated' ):
+        gaussian_separated = Broaden( energy, pdos_separated, eigen_energy, SIGMA, axis=1 )
+    with Stage( 'broaden_cutoff' ):
+        Broaden( energy, pdos_separated, eigen_energy, SIGMA, cutoff=8.0, axis=1 )
+    output_path = os.path.join( case_dir, 'separated' )
+    with Stage( 'save_npz' ):
+        SavePDOS( output_path, gaussian_separated, eigen_energy, 0.0, vasprun['efermi'], 'npz' )
+    with Stage( 'save_npy' ):
+        SavePDOS( output_path, gaussian_separated, eigen_energy, 0.0, vasprun['efermi'], 'npy' )
+    with Stage( 'load_npy' ):
+        LoadPDOS( output_path )['pdos'][0, :, 0].sum()
+    with Stage( 'export_dat' ):
+        ExportPDOS( [output_path], output_path )
+    sum_path = os.path.join( case_dir, 'sum' )
+    with Stage( 'export_dat_other' ):
+        SavePDOS( sum_path, gaussian_sum, eigen_energy, 0.0, vasprun['efermi'], 'npz' )
+        ExportPDOS( [sum_path], sum_path )
+        ExportPDOS( [output_path], output_path + '_x', pdos_on_y=False )
+
+    checks = {'cache': bool( np.array_equal( cached['pdos_raw'], pdos_raw ) )}
+    dat_checks = []
+    for path, pdos, pdos_on_y in ( (output_path, gaussian_separated, True), (sum_path, gaussian_sum, True),
+            (output_path + '_x', gaussian_separated, False) ):
+        ReferenceDat( path + '.reference.dat', pdos, eigen_energy, 0.0, pdos_on_y )
+        dat_checks.append( SameBytes( path + '.dat', path + '.reference.dat' ) )
+    checks['dat'] = all( dat_checks )
+    if reference or ions*ispin*nedos <= REFERENCE_LIMIT:
+        with Stage( 'reference' ):
+            reference_sum, reference_separated = ReferencePDOS( vasprun_path, ion_list, orbitals )
+        checks['sum'] = bool( np.allclose( gaussian_sum, reference_sum, rtol=RTOL, atol=RTOL*np.abs( reference_sum ).max() ) )
+        checks['separated'] = bool( np.allclose( gaussian_separated, reference_separated,
+            rtol=RTOL, atol=RTOL*np.abs( reference_separated ).max() ) )
+    stages = TakeStages()
+    PrintStages( stages )
+    print( "    checks: {}".format( ", ".join( "{} {}".format( key, "ok" if value else "MISMATCH" ) for key, value in checks.items() ) ) )
+
+    return {
+        'ions': ions, 'ispin': ispin, 'nedos': nedos, 'fields': fields,
+        'file_mb': os.path.getsize( vasprun_path )/2**20,
+        'stages': stages,
+        'checks': checks
+    }
+
+def main( argv ):
+    usage = "benchmarkPDOS.py -c <ions>:<ISPIN>:<NEDOS>[:<fields>] -o <report.json> -d <work dir> -a -m"
+    try:
+        opts, args = getopt.getopt( argv, "hc:o:d:am", ["case=", "out=", "dir=", "all-reference", "memory"] )
+    except getopt.GetoptError:
+        print( usage )
+        sys.exit(2)
+
+    cases = []
+    report_path = 'benchmark_pdos.json'
+    work_dir = None
+    reference = False
+    for opt, arg in opts:
+        if opt == "-h":
+            print( usage )
+            sys.exit()
+        elif opt in ( "-c", "--case" ):
+            cases.append( arg )
+        elif opt in ( "-o", "--out" ):
+            report_path = arg
+        elif opt in ( "-d", "--dir" ):
+            work_dir = arg
+        elif opt in ( "-a", "--all-reference" ):
+            reference = True
+        elif opt in ( "-m", "--memory" ):
+            instrumentation.TRACE_MEMORY = True
+
+    instrumentation.ENABLED = True
+    keep = work_dir is not None
+    work_dir = work_dir or tempfile.mkdtemp( prefix='benchmark_pdos_' )
+    try:
+        results = [RunCase( case.split( ':' ), work_dir, reference ) for case in cases or DEFAULT_CASES]
+    finally:
+        if not keep:
+            shutil.rmtree( work_dir )
+    WriteJSON( report_path, {'cases': results} )
+    print( "report written on file " + report_path )
+    if not all( all( result['checks'].values() ) for result in results ):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Ragged storage and segmented statistics of bond lengths
+
+The bond lengths of every strain step, layer and atom are kept in one flat
+array. Three offset arrays delimit the segments: atom_offsets indexes the
+bonds of each atom, layer_offsets the atoms of each (strain, layer) pair
+and strain_offsets the layers of each strain step, as in a CSR matrix.
+Every statistic is then a reduceat over contiguous segments, without
+Python loops over strains, layers or atoms.
+
+The container and its statistics are saved together in one .npz file.'''
+
+import numpy as np
+
+def RaggedBonds ( results, sites_Na ):
+    '''results, one dict per strain step with the flat 'distances' over the
+    atoms of sites_Na and the number of 'bonds' of each atom
+    sites_Na, the 1-based atoms of each layer'''
+    atoms_per_layer = np.array( [len( atom_list ) for atom_list in sites_Na], dtype=np.int64 )
+    bonds = np.concatenate( [np.asarray( result['bonds'], dtype=np.int64 ) for result in results] )
+    return {
+        'distances': np.concatenate( [np.asarray( result['distances'], dtype=float ) for result in results] ),
+        'atom_offsets': np.concatenate( ([0], np.cumsum( bonds )) ),
+        'layer_offsets': np.concatenate( ([0], np.cumsum( np.tile( atoms_per_layer, len( results ) ) )) ),
+        'strain_offsets': np.arange( len( results ) + 1, dtype=np.int64 )*len( sites_Na ),
+        'sites': np.tile( np.concatenate( sites_Na ), len( results ) )
+    }
+
+def SegmentStats ( values, offsets ):
+    '''mean, std, min and max of values[offsets[i]:offsets[i+1]] for each i,
+    where offsets go from 0 to len( values ); nan for empty segments'''
+    values = np.asarray( values, dtype=float )
+    counts = np.diff( offsets )
+    filled = counts > 0
+    # reduceat over the non empty segments only: each one ends where the next starts
+    starts = offsets[:-1][filled]
+    stats = {name: np.full( len( counts ), np.nan ) for name in ( 'mean', 'std', 'min', 'max' )}
+    if not len( starts ):
+        return stats
+    mean = np.add.reduceat( values, starts )/counts[filled]
+    deviation = values - np.repeat( mean, counts[filled] )
+    stats['mean'][filled] = mean
+    stats['std'][filled] = np.sqrt( np.add.reduceat( deviation**2, starts )/counts[filled] )
+    stats['min'][filled] = np.minimum.reduceat( values, starts )
+    stats['max'][filled] = np.maximum.reduceat( values, starts )
+    return stats
+
+def BondStats ( bonds ):
+    '''Per atom, per (strain, layer) and per strain statistics of the bonds.
+    Also the layer average of the atom means ('layer_atom_mean') and the
+    spread of the atom standard deviations ('layer_atom_std'), which measure
+    the polyhedra deformation; a st dev close to 0 points to regular polyhedra.'''
+    atom_offsets = bonds['atom_offsets']
+    layer_bonds = atom_offsets[bonds['layer_offsets']]
+    strain_bonds = layer_bonds[bonds['strain_offsets']]
+    shape = (len( bonds['strain_offsets'] ) - 1, -1)
+
+    stats = {}
+    for level, offsets in ( ('atom', atom_offsets), ('layer', layer_bonds), ('strain', strain_bonds) ):
+        for name, value in SegmentStats( bonds['distances'], offsets ).items():
+            stats[level + '_' + name] = value.reshape( shape ) if level == 'layer' else value
+    stats['layer_atom_mean'] = SegmentStats( stats['atom_mean'], bonds['layer_offsets'] )['mean'].reshape( shape )
+    stats['layer_atom_std'] = SegmentStats( stats['atom_std'], bonds['layer_offsets'] )['std'].reshape( shape )
+    return stats
+
+def SaveBondStats ( output_path, bonds, stats ):
+    '''Writes <output_path>.npz and returns its path'''
+    np.savez( output_path + '.npz', **bonds, **stats )
+    return output_path + '.npz'
+
+def LoadBondStats ( input_path ):
+    '''The container and statistics saved by SaveBondStats, as one dict'''
+    with np.load( input_path ) as data:
+        return {name: data[name] for name in data.files}
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Broadening of Dirac-delta-like states into Gaussian-like (or Lorentzian,
+pseudo-Voigt) lines
+
+Broaden replaces the per (spin, numdos[, orbital]) calls to Gaussian by one
+kernel-matrix product over every spin and orbital at once. The output grid
+is independent of NEDOS. With a cutoff at n*sigma only the states inside the
+window of each block of grid points are evaluated, so the cost becomes close
+to linear in NEDOS.'''
+
+import numpy as np
+from instrumentation import Stage
+
+KERNELS = ('gaussian', 'lorentzian', 'pseudo-voigt')
+# Number of kernel matrix elements evaluated at once
+BLOCK_SIZE = 1 << 22
+
+def Gaussian ( x, mu, sigma, height ):
+    return height*np.exp( -0.5*np.power( (x - mu)/sigma, 2 ) )
+
+def Lorentzian ( x, mu, sigma, height ):
+    return height/(1.0 + np.power( (x - mu)/sigma, 2 ))
+
+def Kernel ( delta, sigma, kernel='gaussian', eta=0.5 ):
+    '''Line shape with unit height at delta = 0, as Gaussian with height=1.
+    sigma is the Gaussian standard deviation and the Lorentzian half width.
+    eta is the Lorentzian fraction of the pseudo-Voigt profile.'''
+    if kernel == 'gaussian':
+        return Gaussian( delta, 0.0, sigma, 1.0 )
+    elif kernel == 'lorentzian':
+        return Lorentzian( delta, 0.0, sigma, 1.0 )
+    elif kernel == 'pseudo-voigt':
+        return eta*Lorentzian( delta, 0.0, sigma, 1.0 ) + (1.0 - eta)*Gaussian( delta, 0.0, sigma, 1.0 )
+    raise ValueError( "kernel should be one of {}, not {}".format( KERNELS, kernel ) )
+
+def Broaden ( energy, weights, grid, sigma, kernel='gaussian', cutoff=None, eta=0.5, axis=-1 ):
+    '''Sum of kernels centred at each energy[numdos] with height weights[..., numdos],
+    evaluated on grid.
+
+    energy, an np.array with dimensions (nedos), sorted
+    weights, an np.array whose axis `axis` has nedos points, e.g. (ispin, nedos)
+        or (ispin, nedos, orbitals) with axis=1
+    grid, an np.array with dimensions (numpoints)
+    cutoff, the kernel is neglected beyond cutoff*sigma (None evaluates every state)
+
+    Returns weights with axis `axis` replaced by numpoints.'''
+    with Stage( 'broadening', items=np.size( weights ) ):
+        energy = np.asarray( energy, dtype=float )
+        grid = np.asarray( grid, dtype=float )
+        weights = np.moveaxis( np.asarray( weights, dtype=float ), axis, -1 )
+        batch_shape = weights.shape[:-1]
+        weights = weights.reshape( -1, len( energy ) )
+        broadened = np.zeros( (weights.shape[0], len( grid )) )
+
+        order = np.argsort( grid )
+        sorted_grid = grid[order]
+        window = len( energy )
+        step = max( 1, BLOCK_SIZE//window )
+        if cutoff is not None:
+            # Blocks about one window wide keep the evaluated band narrow
+            energy_spacing = (energy[-1] - energy[0])/max( len( energy ) - 1, 1 )
+            grid_spacing = (sorted_grid[-1] - sorted_grid[0])/max( len( grid ) - 1, 1 )
+            window = min( window, int( 2*cutoff*sigma/max( energy_spacing, 1e-300 ) ) + 2 )
+            step = max( 1, min( BLOCK_SIZE//(2*window), int( 2*cutoff*sigma/max( grid_spacing, 1e-300 ) ) + 1 ) )
+
+        for start in range( 0, len( grid ), step ):
+            block = sorted_grid[start:start + step]
+            first, last = 0, len( energy )
+            if cutoff is not None:
+                first = np.searchsorted( energy, block[0] - cutoff*sigma, side='left' )
+                last = np.searchsorted( energy, block[-1] + cutoff*sigma, side='right' )
+                if first >= last:
+                    continue
+            delta = block[:, np.newaxis] - energy[np.newaxis, first:last]
+            kernel_matrix = Kernel( delta, sigma, kernel, eta )
+            if cutoff is not None:
+                kernel_matrix[np.abs( delta ) > cutoff*sigma] = 0.0
+            broadened[:, order[start:start + step]] = weights[:, first:last] @ kernel_matrix.T
+
+    return np.moveaxis( broadened.reshape( batch_shape + (len( grid ),) ), -1, axis )
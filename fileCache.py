@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Helpers to key on-disk caches by the content of their input files
+
+A cache entry records the size, modification time and SHA-1 digest of each
+input file. The cheap size/mtime stamp is checked first; the digest is only
+recomputed when the stamp changed, so a touched but otherwise identical file
+is still a cache hit.'''
+
+import hashlib
+import json
+import os
+
+CHUNK_SIZE = 1 << 24
+
+def FileStamp ( path ):
+    status = os.stat( path )
+    return {'size': status.st_size, 'mtime_ns': status.st_mtime_ns}
+
+def FileDigest ( path ):
+    digest = hashlib.sha1()
+    with open( path, 'rb' ) as source:
+        for chunk in iter( lambda: source.read( CHUNK_SIZE ), b'' ):
+            digest.update( chunk )
+    return digest.hexdigest()
+
+def FileRecord ( path ):
+    record = FileStamp( path )
+    record['sha1'] = FileDigest( path )
+    return record
+
+def IsFresh ( path, record ):
+    '''True if the file at path still matches a FileRecord taken earlier'''
+    if record is None or not os.path.exists( path ):
+        return False
+    stamp = FileStamp( path )
+    if stamp['size'] != record.get( 'size' ):
+        return False
+    if stamp['mtime_ns'] == record.get( 'mtime_ns' ):
+        return True
+    return FileDigest( path ) == record.get( 'sha1' )
+
+def ReadJSON ( path ):
+    try:
+        with open( path ) as source:
+            return json.load( source )
+    except (OSError, ValueError):
+        return None
+
+def WriteJSON ( path, data ):
+    '''Atomic write: readers never see a half written file'''
+    temporary = path + '.tmp'
+    with open( temporary, 'w' ) as output:
+        json.dump( data, output, indent=1 )
+    os.replace( temporary, path )
@@ -1,7 +1,26 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+'''Na-Na distances of the slab, from the CONTCAR or along an XDATCAR
 
+Without options the CONTCAR is read and distNa.txt written. With -x the
+trajectory is streamed in chunks of frames and the time series (absolute
+x, y, z components in Å, float32) are written to the directory
+<output>.traj: frames.npy, neighbour.npy (frames, pairs, 3),
+interlayer.npy (frames, pairs/2, 3) and middle.npy (frames, 2, pairs, 3).
+
+With -a the tables below are replaced by the ones slabLayers.py builds from
+the Na layers of the CONTCAR (of the first frame with -x).
+
+Usage: geometryNaDist.py [-x <XDATCAR> [-o <output>] [-c <chunk>] [-s <start>:<stop>:<stride>]] [-a [-t <tolerance in Å>]]'''
+
+import sys, getopt
+import os
 import numpy as np
+from instrumentation import Progress
+from periodicDistance import PairVectors
+from poscarReader import ReadPOSCAR, SpeciesIndices
+from slabLayers import DEFAULT_TOLERANCE, DetectLayers, MiddleTable, NeighbourTable
+from xdatcarReader import CountFrames, IterFrames, ReadXDATCARHeader
 
 # List of atoms to search at the CONTCAR file
 
@@ -34,39 +53,135 @@ listMiddleNa = np.array([
     [62, 53]
 ])
 middleNa = np.array([57, 66])
+# Layer of middleNa, 1-based from the bottom
+middleLayer = 5
+
+def AutoTables ( frac, lattice, atoms, tolerance=DEFAULT_TOLERANCE ):
+    """
+    Replaces listNeighbourNa, listMiddleNa and middleNa (1-based) by the tables of the Na layers
+    """
+    global listNeighbourNa, listMiddleNa, middleNa, middleLayer
+    layers = DetectLayers( frac, lattice, atoms, tolerance )
+    # raises for an even number of layers, which has no middle layer
+    middle, rows = MiddleTable( layers, frac, lattice )
+    if len( middle ) != 2:
+        raise ValueError( "the middle Na layer should have 2 atoms, not {}".format( len( middle ) ) )
+    listNeighbourNa = NeighbourTable( layers, frac, lattice ) + 1
+    middleNa = middle + 1
+    listMiddleNa = rows + 1
+    middleLayer = len( layers )//2 + 1
+
+def NaDistances ( posList, simBox ):
+    """
+    CONTCAR is in fractional cartesian coordinates. The atom vectors are the minimum image of dist*simBox
+    More at: https://www.vasp.at/wiki/wiki/index.php/POSCAR
+    posList and simBox may have a leading frames dimension
+    """
+    if simBox.ndim == 3:
+        simBox = simBox[:, np.newaxis]
+    distFirstNa = np.absolute( PairVectors( posList, simBox, listNeighbourNa - 1 )[0] )
+
+    distMiddleNa = np.stack( [np.absolute( PairVectors( posList, simBox,
+        np.stack( (listMiddleNa[:, side], np.full( len( listMiddleNa ), middleNa[side] )), axis=-1 ) - 1 )[0] )
+        for side in range( 2 )], axis=-3 )
+
+    half = int( 0.5*listMiddleNa.shape[0] )
+    averagedDistMiddleNa = 0.25*(distMiddleNa[..., 0, :half, :] + distMiddleNa[..., 1, :half, :]
+        + distMiddleNa[..., 0, half:2*half, :] + distMiddleNa[..., 1, half:2*half, :])
+    return distFirstNa, distMiddleNa, averagedDistMiddleNa
+
+def WriteDistances ( output_path, distFirstNa, distMiddleNa, averagedDistMiddleNa ):
+    with open(output_path, 'w') as output:
+        output.write( '--------------------\nNeighbours Na\n--------------------\nát. át. ΔX (Å)\n' )
+        for i in range( len( distFirstNa ) ):
+            output.write( '{} {} {:.3E}\n'.format( listNeighbourNa[i][0], listNeighbourNa[i][1], distFirstNa[i][0] ) )
+        output.write( '--------------------\nInterlayer distance\n--------------------\n')
+        for i in range(  len( averagedDistMiddleNa ) ):
+            output.write( '{} 🠆 {} {:.3E}\n'.format( i+1, middleLayer, averagedDistMiddleNa[i][0] ) )
+        output.write( '--------------------\nFrom the middle Na\n--------------------\nát. át. ΔX (Å)\n' )
+        for i in range( int( 0.5*distMiddleNa.shape[1] ) ):
+            output.write( '{} {} {:.3E}\n'.format( listMiddleNa[i][0], middleNa[0], distMiddleNa[0][i][0] ) )
+        for i in range( int( 0.5*distMiddleNa.shape[1] ) ):
+            output.write( '{} {} {:.3E}\n'.format( listMiddleNa[i][1], middleNa[1], distMiddleNa[1][i][0] ) )
+
+def TrajectoryDistances ( xdatcar_path, output_path, chunk=1000, start=0, stop=None, stride=1 ):
+    """
+    Streams the XDATCAR and fills the memory-mapped time series chunk by chunk
+    Returns the output directory
+    """
+    total = CountFrames( xdatcar_path )
+    nframes = len( range( start, total if stop is None else min( stop, total ), stride ) )
+    directory = output_path + '.traj'
+    os.makedirs( directory, exist_ok=True )
+    shapes = {
+        'frames': (nframes,),
+        'neighbour': (nframes, len( listNeighbourNa ), 3),
+        'interlayer': (nframes, int( 0.5*listMiddleNa.shape[0] ), 3),
+        'middle': (nframes, 2, len( listMiddleNa ), 3)
+    }
+    series = {name: np.lib.format.open_memmap( os.path.join( directory, name + '.npy' ), mode='w+',
+        dtype=np.int64 if name == 'frames' else np.float32, shape=shape ) for name, shape in shapes.items()}
+
+    done = 0
+    progress = Progress( "reading frames", nframes )
+    for frames in IterFrames( xdatcar_path, chunk, start, stop, stride ):
+        distFirstNa, distMiddleNa, averagedDistMiddleNa = NaDistances( frames['frac'], frames['lattice'] )
+        window = slice( done, done + len( frames['frames'] ) )
+        series['frames'][window] = frames['frames']
+        series['neighbour'][window] = distFirstNa
+        series['interlayer'][window] = averagedDistMiddleNa
+        series['middle'][window] = distMiddleNa
+        done = window.stop
+        progress.update( len( frames['frames'] ) )
+    for array in series.values():
+        array.flush()
+    return directory
+
+def main( argv ):
+    usage = "geometryNaDist.py [-x <XDATCAR> -o <output> -c <chunk> -s <start>:<stop>:<stride>] [-a -t <tolerance in Å>]"
+    try:
+        opts, args = getopt.getopt( argv, "hx:o:c:s:at:", ["xdatcar=", "out=", "chunk=", "slice=", "auto", "tolerance="] )
+    except getopt.GetoptError:
+        print( usage )
+        sys.exit(2)
+
+    xdatcar_path = None
+    output_path = 'distNa'
+    chunk = 1000
+    window = [0, None, 1]
+    auto = False
+    tolerance = DEFAULT_TOLERANCE
+    for opt, arg in opts:
+        if opt == "-h":
+            print( usage )
+            sys.exit()
+        elif opt in ( "-x", "--xdatcar" ):
+            xdatcar_path = arg
+        elif opt in ( "-o", "--out" ):
+            output_path = arg
+        elif opt in ( "-c", "--chunk" ):
+            chunk = int( arg )
+        elif opt in ( "-s", "--slice" ):
+            # start:stop:stride, any of them may be empty
+            for index, value in enumerate( arg.split( ':' )[:3] ):
+                if value:
+                    window[index] = int( value )
+        elif opt in ( "-a", "--auto" ):
+            auto = True
+        elif opt in ( "-t", "--tolerance" ):
+            tolerance = float( arg )
 
-posList = np.genfromtxt( 'CONTCAR', skip_header=8, skip_footer=86, delimiter='  ' )
-simBox = np.genfromtxt( 'CONTCAR', skip_header=2, skip_footer=175, delimiter='    ' )
-
-distFirstNa = np.zeros( (len( listNeighbourNa ), 3) )
-
-for i in range( len( listNeighbourNa ) ):
-"""
-CONTCAR is in fractional cartesian coordinates. The atom distance is the matrix product of dist*simBox
-More at: https://www.vasp.at/wiki/wiki/index.php/POSCAR
-"""
-    distFirstNa[i] = np.matmul(np.absolute(posList[listNeighbourNa[i][1] - 1] - posList[listNeighbourNa[i][0] - 1]), simBox)
-
-distMiddleNa = np.zeros( (2, len( listMiddleNa ), 3) )
-averagedDistMiddleNa = np.zeros( (int(0.5*listMiddleNa.shape[0]), 3) )
-
-for i in range( len( listMiddleNa ) ):
-    distMiddleNa[0][i] = np.matmul(np.absolute(posList[middleNa[0] - 1] - posList[listMiddleNa[i][0] - 1]), simBox)
-    distMiddleNa[1][i] = np.matmul(np.absolute(posList[middleNa[1] - 1] - posList[listMiddleNa[i][1] - 1]), simBox)
-
-for i in range( len( averagedDistMiddleNa ) ):
-    averagedDistMiddleNa[i] = 0.25*(distMiddleNa[0][i] + distMiddleNa[1][i] + distMiddleNa[0][4+i] + distMiddleNa[1][4+i])
-
-with open('distNa.txt', 'w') as output:
-    output.write( '--------------------\nNeighbours Na\n--------------------\nát. át. ΔX (Å)\n' )
-    for i in range( len( distFirstNa ) ):
-        output.write( '{} {} {:.3E}\n'.format( listNeighbourNa[i][0], listNeighbourNa[i][1], distFirstNa[i][0] ) )
-    output.write( '--------------------\nInterlayer distance\n--------------------\n')
-    for i in range(  len( averagedDistMiddleNa ) ):
-        output.write( '{} 🠆 5 {:.3E}\n'.format( i+1, averagedDistMiddleNa[i][0] ) )
-    output.write( '--------------------\nFrom the middle Na\n--------------------\nát. át. ΔX (Å)\n' )
-    for i in range( int( 0.5*distMiddleNa.shape[1] ) ):
-        output.write( '{} {} {:.3E}\n'.format( listMiddleNa[i][0], middleNa[0], distMiddleNa[0][i][0] ) )
-    for i in range( int( 0.5*distMiddleNa.shape[1] ) ):
-        output.write( '{} {} {:.3E}\n'.format( listMiddleNa[i][1], middleNa[1], distMiddleNa[1][i][0] ) )
+    if xdatcar_path is None:
+        contcar = ReadPOSCAR( 'CONTCAR' )
+        if auto:
+            AutoTables( contcar['frac'], contcar['lattice'], SpeciesIndices( contcar, 'Na' ), tolerance )
+        WriteDistances( 'distNa.txt', *NaDistances( contcar['frac'], contcar['lattice'] ) )
+    else:
+        if auto:
+            first = next( IterFrames( xdatcar_path, chunk=1, stop=1 ) )
+            AutoTables( first['frac'][0], first['lattice'][0], SpeciesIndices( ReadXDATCARHeader( xdatcar_path ), 'Na' ), tolerance )
+        directory = TrajectoryDistances( xdatcar_path, output_path, chunk, *window )
+        print( "time series written on " + directory )
 
+if __name__ == "__main__":
+    main(sys.argv[1:])
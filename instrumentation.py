@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Opt-in stage profiling and progress report for the PDOS scripts
+
+Setting the environment variable PDOS_PROFILE to a file name, e.g.
+    PDOS_PROFILE=profile.json ./pdosSum.py
+records, for every stage (xml_read, row_parsing, orbital_summation,
+broadening, serialization, ...), the number of calls, wall time, CPU time,
+resident memory growth and items processed, and writes them as JSON when
+the run ends, with the peak resident memory of the whole run. Without
+PDOS_PROFILE a Stage costs one attribute lookup.
+
+rss_growth_mb is the largest growth of the resident memory between the
+start and the end of one call of the stage (Linux only, None elsewhere):
+the memory the stage leaves allocated, e.g. the arrays it returns, and not
+its transient peak, which the process can reach and release inside the
+block.
+
+Stages can be nested (row_parsing runs inside xml_read): wall and cpu are
+the inclusive times, self_wall and self_cpu exclude the nested stages, and
+nested_in names the enclosing stage, so only the self times add up to the
+run time. Stages timed in process pool workers (pdosBatch.py,
+bandGapSummary.py) are returned with each task result (TakeStages) and
+merged into the report of the parent (MergeStages); their times are summed
+over the workers, like CPU time.
+
+With TRACE_MEMORY set (benchmarkPDOS.py -m) every stage also records in
+peak_traced_mb the largest tracemalloc peak of one call over the traced
+memory at its start, i.e. the peak of the Python and numpy allocations made
+in the block, nested stages included; tracing slows the Python-heavy
+stages, so it is off by default.
+
+Progress replaces the per item prints: it redraws a single line on stderr
+at most every PROGRESS_INTERVAL seconds (every PROGRESS_INTERVAL_PIPE when
+stderr is not a terminal, e.g. in a batch job log).'''
+
+import atexit
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PROFILE_PATH = os.environ.get( 'PDOS_PROFILE' )
+ENABLED = bool( PROFILE_PATH )
+TRACE_MEMORY = False
+PROGRESS_INTERVAL = 0.5
+PROGRESS_INTERVAL_PIPE = 30.0
+
+STAGES = {}
+# Stages being timed, innermost last
+ACTIVE = []
+START = time.time()
+
+def CurrentRSS ():
+    '''Resident set size of the process in MB (None if unknown)'''
+    try:
+        with open( '/proc/self/statm' ) as statm:
+            return int( statm.read().split()[1] )*os.sysconf( 'SC_PAGE_SIZE' )/2**20
+    except (OSError, ValueError):
+        return None
+
+def PeakRSS ():
+    '''Peak resident set size of the process in MB (None if unknown)'''
+    if resource is None:
+        return None
+    peak = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return peak/2**20 if sys.platform == 'darwin' else peak/2**10
+
+class Stage:
+    '''with Stage( 'broadening', items=nedos ) as stage: ...
+    stage.items can also be increased inside the block'''
+    def __init__ ( self, name, items=0 ):
+        self.name = name
+        self.items = items
+
+    def __enter__ ( self ):
+        if ENABLED:
+            self.parent = ACTIVE[-1] if ACTIVE else None
+            self.child_wall = self.child_cpu = 0.0
+            ACTIVE.append( self )
+            self.rss = CurrentRSS()
+            if TRACE_MEMORY:
+                self.started = not tracemalloc.is_tracing()
+                if self.started:
+                    tracemalloc.start()
+                elif self.parent is not None:
+                    # the peak reached so far in the enclosing stage survives reset_peak
+                    self.parent.traced_peak = max( self.parent.traced_peak, tracemalloc.get_traced_memory()[1] )
+                tracemalloc.reset_peak()
+                self.traced_start = self.traced_peak = tracemalloc.get_traced_memory()[0]
+            self.wall = time.perf_counter()
+            self.cpu = time.process_time()
+        return self
+
+    def __exit__ ( self, *exc_info ):
+        if ENABLED:
+            wall = time.perf_counter() - self.wall
+            cpu = time.process_time() - self.cpu
+            ACTIVE.pop()
+            record = STAGES.setdefault( self.name, NewRecord() )
+            if TRACE_MEMORY and tracemalloc.is_tracing():
+                peak = max( self.traced_peak, tracemalloc.get_traced_memory()[1] )
+                record['peak_traced_mb'] = max( (peak - self.traced_start)/2**20, record['peak_traced_mb'] or 0.0 )
+                if self.parent is not None:
+                    self.parent.traced_peak = max( self.parent.traced_peak, peak )
+                if self.started:
+                    tracemalloc.stop()
+            rss = CurrentRSS()
+            if rss is not None and self.rss is not None:
+                record['rss_growth_mb'] = max( rss - self.rss, record['rss_growth_mb'] or 0.0 )
+            record['calls'] += 1
+            record['wall'] += wall
+            record['cpu'] += cpu
+            record['self_wall'] += wall - self.child_wall
+            record['self_cpu'] += cpu - self.child_cpu
+            record['items'] += int( self.items )
+            if self.parent is not None:
+                self.parent.child_wall += wall
+                self.parent.child_cpu += cpu
+                record['nested_in'] = record['nested_in'] or self.parent.name
+        return False
+
+def NewRecord ():
+    return {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'self_wall': 0.0, 'self_cpu': 0.0, 'items': 0,
+        'rss_growth_mb': None, 'peak_traced_mb': None, 'nested_in': None}
+
+def TakeStages ():
+    '''Stages recorded so far, which are cleared: a pool task calls it when it
+    starts (dropping what a forked worker inherited) and returns it at the end'''
+    taken = dict( STAGES )
+    STAGES.clear()
+    return taken
+
+def MergeStages ( stages ):
+    '''Adds the stages taken in a worker process to the ones of this process'''
+    for name, taken in (stages or {}).items():
+        record = STAGES.setdefault( name, NewRecord() )
+        for key in ( 'calls', 'wall', 'cpu', 'self_wall', 'self_cpu', 'items' ):
+            record[key] += taken[key]
+        for key in ( 'rss_growth_mb', 'peak_traced_mb' ):
+            record[key] = max( filter( None, ( record[key], taken.get( key ) ) ), default=None )
+        record['nested_in'] = record['nested_in'] or taken['nested_in']
+
+class Progress:
+    '''Rate-limited single line progress bar on stderr'''
+    def __init__ ( self, label, total, enabled=True ):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.enabled = enabled
+        self.interval = PROGRESS_INTERVAL if sys.stderr.isatty() else PROGRESS_INTERVAL_PIPE
+        self.start = self.last = time.perf_counter()
+
+    def update ( self, count=1 ):
+        self.done += count
+        now = time.perf_counter()
+        if self.enabled and (now - self.last >= self.interval or self.done == self.total):
+            self.last = now
+            self.draw( now )
+
+    def draw ( self, now ):
+        fraction = self.done/self.total if self.total else 1.0
+        bar = '#'*int( 30*fraction )
+        line = "{} [{:<30}] {}/{} ({:.1f} s)".format( self.label, bar, self.done, self.total, now - self.start )
+        if sys.stderr.isatty():
+            sys.stderr.write( '\r' + line + ('\n' if self.done >= self.total else '') )
+        else:
+            sys.stderr.write( line + '\n' )
+        sys.stderr.flush()
+
+def Report ():
+    '''The profile of the run so far, as a dict'''
+    return {
+        'argv': sys.argv,
+        'host': platform.node(),
+        'cpu_count': os.cpu_count(),
+        'start': time.strftime( '%Y-%m-%dT%H:%M:%S', time.localtime( START ) ),
+        'wall': time.time() - START,
+        'peak_rss_mb': PeakRSS(),
+        'stages': {name: dict( record, items_per_s=record['items']/record['wall'] if record['wall'] else None )
+            for name, record in STAGES.items()}
+    }
+
+def WriteReport ( path=None ):
+    # pool workers return their stages to the parent, which writes the report
+    if path is None and multiprocessing.parent_process() is not None:
+        return
+    with open( path or PROFILE_PATH, 'w' ) as output:
+        json.dump( Report(), output, indent=1 )
+
+if ENABLED:
+    atexit.register( WriteReport )
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Post-processing script for VASP output
+
+Runs a pdosRecipe.py recipe over many calculation directories (e.g. the
+c5 ... relax ... t5 strain series) on a pool of processes, one task per
+directory. A failing directory is reported and does not stop the others.
+At the end an index of every pDOS output written, per directory, is saved
+as JSON.
+
+Usage: pdosBatch.py -r <recipe.json> [-n <processes>] [-x <index.json>] <dir> [<dir> ...]'''
+
+import sys, getopt
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fileCache import WriteJSON
+from instrumentation import MergeStages, TakeStages
+from pdosRecipe import RunRecipe, ValidateRecipe
+
+def RunDirectory ( recipe, directory ):
+    '''Pool task: never raises, the error is returned in the report'''
+    start = time.time()
+    TakeStages()
+    report = {'directory': directory, 'outputs': [], 'error': None}
+    try:
+        report['outputs'] = RunRecipe( recipe, os.path.join( directory, 'vasprun.xml' ), directory, verbose=False )
+    except Exception:
+        report['error'] = traceback.format_exc()
+    report['seconds'] = time.time() - start
+    report['stages'] = TakeStages()
+    return report
+
+def RunBatch ( recipe, directories, processes=None ):
+    '''Returns the reports of RunDirectory, in the order of directories'''
+    reports = {}
+    with ProcessPoolExecutor( max_workers=processes ) as pool:
+        futures = {pool.submit( RunDirectory, recipe, directory ): directory for directory in directories}
+        for done, future in enumerate( as_completed( futures ), start=1 ):
+            report = future.result()
+            MergeStages( report.pop( 'stages' ) )
+            reports[futures[future]] = report
+            status = "failed" if report['error'] else "{} files".format( len( report['outputs'] ) )
+            print( "[{}/{}] {}: {} ({:.1f} s)".format(
+                done, len( directories ), report['directory'], status, report['seconds'] ) )
+            if report['error']:
+                print( report['error'], file=sys.stderr )
+    return [reports[directory] for directory in directories]
+
+def main( argv ):
+    try:
+        opts, args = getopt.getopt( argv, "hr:n:x:", ["recipe=", "processes=", "index="] )
+    except getopt.GetoptError:
+        print( "pdosBatch.py -r <recipe.json> -n <processes> -x <index.json> <dir> [<dir> ...]" )
+        sys.exit(2)
+
+    recipe_path = None
+    processes = None
+    index_path = 'pdos_index.json'
+    for opt, arg in opts:
+        if opt == "-h":
+            print( "pdosBatch.py -r <recipe.json> -n <processes> -x <index.json> <dir> [<dir> ...]" )
+            sys.exit()
+        elif opt in ( "-r", "--recipe" ):
+            recipe_path = arg
+        elif opt in ( "-n", "--processes" ):
+            processes = int( arg )
+        elif opt in ( "-x", "--index" ):
+            index_path = arg
+
+    if recipe_path is None or not args:
+        print( "pdosBatch.py -r <recipe.json> -n <processes> -x <index.json> <dir> [<dir> ...]" )
+        sys.exit(2)
+    with open( recipe_path ) as source:
+        recipe = json.load( source )
+    # refused once here rather than by every task
+    try:
+        ValidateRecipe( recipe )
+    except ValueError as error:
+        print( "{}: {}".format( recipe_path, error ) )
+        sys.exit(2)
+
+    reports = RunBatch( recipe, args, processes )
+    WriteJSON( index_path, {
+        'recipe': recipe_path,
+        'runs': reports
+    })
+    failed = [report['directory'] for report in reports if report['error']]
+    print( "index written on file {} ({} of {} directories failed)".format( index_path, len( failed ), len( reports ) ) )
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Persistent binary cache of the partial DOS in vasprun.xml
+
+The first call converts the full (ion, ispin, nedos, fields) <partial> tensor
+into a .npy file inside CACHE_DIR, next to the vasprun.xml, writing each set
+straight into the memory-mapped file as it is parsed so that the tensor is
+never held in memory as a whole, and records the
+vasprun.xml size, mtime and SHA-1 alongside it. Later calls memory-map the
+.npy and copy only the requested ions, so trying a different ion_list or
+orbitals mask costs milliseconds instead of a full parse.
+
+Usage: pdosCache.py -i <vasprun.xml> [-i <another/vasprun.xml> ...]'''
+
+import sys, getopt
+import os
+import numpy as np
+from fileCache import FileRecord, FileStamp, IsFresh, ReadJSON, WriteJSON
+from instrumentation import Stage
+from vasprunReader import CheckIons, ReadPartialDOS
+
+CACHE_DIR = '.pdos_cache'
+
+def CachePaths ( vasprun_path ):
+    cache_dir = os.path.join( os.path.dirname( os.path.abspath( vasprun_path ) ), CACHE_DIR )
+    return cache_dir, os.path.join( cache_dir, 'partial.npy' ), os.path.join( cache_dir, 'partial.json' )
+
+def BuildCache ( vasprun_path, verbose=True ):
+    '''Parses the full <partial> block once and stores it in the cache'''
+    cache_dir, array_path, meta_path = CachePaths( vasprun_path )
+    os.makedirs( cache_dir, exist_ok=True )
+    record = FileRecord( vasprun_path )
+    if verbose:
+        print( "converting {} into {}".format( vasprun_path, array_path ) )
+    temporary = array_path + '.tmp'
+    vasprun = ReadPartialDOS( vasprun_path, verbose=verbose,
+        allocate=lambda shape: np.lib.format.open_memmap( temporary, mode='w+', dtype=np.float64, shape=shape ) )
+    if vasprun['pdos_raw'] is None:
+        raise ValueError( "{} has no <partial> block".format( vasprun_path ) )
+    with Stage( 'serialization', items=vasprun['pdos_raw'].size ):
+        vasprun['pdos_raw'].flush()
+    del vasprun['pdos_raw']
+    os.replace( temporary, array_path )
+    WriteJSON( meta_path, {
+        'vasprun': record,
+        'ispin': vasprun['ispin'],
+        'nedos': vasprun['nedos'],
+        'efermi': vasprun['efermi'],
+        'fields': vasprun['fields']
+    })
+
+def LoadPartialDOS ( vasprun_path, ion_list=None, verbose=True ):
+    '''Same interface and return value as vasprunReader.ReadPartialDOS, served
+    from the cache. The cache is (re)built when missing or stale.'''
+    cache_dir, array_path, meta_path = CachePaths( vasprun_path )
+    meta = ReadJSON( meta_path )
+    if meta is None or not os.path.exists( array_path ) or not IsFresh( vasprun_path, meta['vasprun'] ):
+        BuildCache( vasprun_path, verbose )
+        meta = ReadJSON( meta_path )
+    elif FileStamp( vasprun_path )['mtime_ns'] != meta['vasprun']['mtime_ns']:
+        # Touched but identical: store the new stamp to skip the digest next time
+        meta['vasprun'].update( FileStamp( vasprun_path ) )
+        WriteJSON( meta_path, meta )
+
+    pdos_all = np.load( array_path, mmap_mode='r' )
+    if ion_list is not None:
+        # ion 0 would silently be read as the last one
+        CheckIons( ion_list, len( pdos_all ) )
+    with Stage( 'cache_load', items=len( pdos_all ) if ion_list is None else len( ion_list ) ):
+        if ion_list is None:
+            pdos_raw = np.array( pdos_all )
+        else:
+            pdos_raw = pdos_all[np.asarray( ion_list ) - 1]
+    del pdos_all
+
+    return {
+        'ispin': meta['ispin'],
+        'nedos': meta['nedos'],
+        'efermi': meta['efermi'],
+        'fields': meta['fields'],
+        'pdos_raw': pdos_raw
+    }
+
+def main( argv ):
+    try:
+        opts, args = getopt.getopt( argv, "hi:", ["in="] )
+    except getopt.GetoptError:
+        print( "pdosCache.py -i <vasprun.xml>" )
+        sys.exit(2)
+
+    input_files = []
+    for opt, arg in opts:
+        if opt == "-h":
+            print( "pdosCache.py -i <vasprun.xml>" )
+            sys.exit()
+        elif opt in ( "-i", "--in" ):
+            input_files.append( arg )
+
+    for vasprun_path in input_files or ['vasprun.xml']:
+        LoadPartialDOS( vasprun_path )
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
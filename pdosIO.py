@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Input and output of the pickled pDOS files
+
+A pDOS output <name> is stored in one of two formats:
+    * 'npz' (default), the compressed <name>.npz archive
+    * 'npy' (opt-in), the directory <name>.pdos holding pdos.npy,
+      eigen_energy.npy, eigen_adjust.npy and e_fermi.npy, uncompressed so
+      that readers memory-map the arrays and only touch the energy window
+      or spin channel they slice
+LoadPDOS detects the format by itself, preferring the newest one.
+
+WritePDOS exports the pDOS in the plain text .dat layout read by gnuplot:
+for each orbital (a single one for the summed pDOS) a block with the spin up
+channel and a block with the spin down channel (negated), each followed by a
+blank line. A pDOS without spin down (ISPIN=1, or the total, mx, my, mz
+components of a non-collinear run) repeats the total as the negated block.
+Every block is formatted by one %-format call over the whole
+array and written through a large buffer.'''
+
+import sys
+import os
+import numpy as np
+from instrumentation import Stage
+
+WRITE_BUFFER = 1 << 20
+FORMATS = ('npy', 'npz')
+DEFAULT_FORMAT = 'npz'
+ARRAYS = ('pdos', 'eigen_energy', 'eigen_adjust', 'e_fermi')
+
+def SavePDOS ( output_path, pdos, eigen_energy, eigen_adjust, e_fermi, output_format=DEFAULT_FORMAT ):
+    '''Writes <output_path>.pdos (npy) or <output_path>.npz and returns its path'''
+    arrays = {
+        'pdos': np.asarray( pdos ),
+        'eigen_energy': np.asarray( eigen_energy ),
+        'eigen_adjust': np.asarray( eigen_adjust ),
+        'e_fermi': np.asarray( e_fermi )
+    }
+    if output_format == 'npz':
+        with Stage( 'serialization', items=arrays['pdos'].size ):
+            np.savez_compressed( output_path + '.npz', **arrays )
+        return output_path + '.npz'
+    elif output_format == 'npy':
+        directory = output_path + '.pdos'
+        os.makedirs( directory, exist_ok=True )
+        with Stage( 'serialization', items=arrays['pdos'].size ):
+            for name, array in arrays.items():
+                temporary = os.path.join( directory, name + '.tmp.npy' )
+                np.save( temporary, array )
+                os.replace( temporary, os.path.join( directory, name + '.npy' ) )
+        return directory
+    raise ValueError( "output_format should be one of {}, not {}".format( FORMATS, output_format ) )
+
+def ResolvePDOS ( input_path ):
+    '''Path of the stored pDOS <input_path>, with the newest format first'''
+    candidates = [path for path in ( input_path + '.pdos', input_path + '.npz' ) if os.path.exists( path )]
+    if not candidates:
+        raise FileNotFoundError( "neither {0}.pdos nor {0}.npz exist".format( input_path ) )
+    return max( candidates, key=os.path.getmtime )
+
+def LoadPDOS ( input_path, mmap=True ):
+    '''Reads the pDOS <input_path> (no extension) in either format.
+    From a .pdos directory pdos and eigen_energy are memory-mapped unless mmap
+    is False; a .npz archive is read with a single np.load.'''
+    path = ResolvePDOS( input_path )
+    if path.endswith( '.pdos' ):
+        mmap_mode = 'r' if mmap else None
+        data = {name: np.load( os.path.join( path, name + '.npy' ), mmap_mode=mmap_mode ) for name in ARRAYS[:2]}
+        for name in ARRAYS[2:]:
+            data[name] = float( np.load( os.path.join( path, name + '.npy' ) ) )
+        return data
+    with np.load( path ) as data:
+        return {
+            'pdos': data['pdos'],
+            'eigen_energy': data['eigen_energy'],
+            'eigen_adjust': float( data['eigen_adjust'] ),
+            'e_fermi': float( data['e_fermi'] ) if 'e_fermi' in data.files else None
+        }
+
+def SpinDownIndex ( pdos ):
+    '''Index of the spin down channel of pdos (spin components first): 1 for
+    ISPIN=2, None for ISPIN=1 and for a non-collinear run, whose components
+    1-3 are the magnetization (mx, my, mz) and not a spin channel'''
+    if pdos.shape[0] == 2:
+        return 1
+    if pdos.shape[0] in ( 1, 4 ):
+        return None
+    raise ValueError( "expected 1, 2 or 4 spin components, not {}".format( pdos.shape[0] ) )
+
+def FormatBlock ( x, y ):
+    '''"{:f} {:f}\\n" for every (x, y) pair, in one formatting call'''
+    columns = np.empty( (len( x ), 2) )
+    columns[:, 0] = x
+    columns[:, 1] = y
+    return ("%f %f\n"*len( x )) % tuple( columns.ravel().tolist() ) + "\n"
+
+def WritePDOS ( output, pdos, eigen_energy, eigen_adjust, pdos_on_y=True ):
+    '''output, an open text file
+    pdos, an np.array with dimensions (ispin, numpoints) or (ispin, numpoints, orbitals)'''
+    energy = eigen_energy + eigen_adjust
+    if pdos.ndim == 2:
+        pdos = pdos[..., np.newaxis]
+    down = SpinDownIndex( pdos )
+    if down is None:
+        down = 0
+    with Stage( 'export', items=2*pdos.shape[1]*pdos.shape[2] ):
+        for orbital in range( pdos.shape[2] ):
+            for spin, sign in ( (0, 1.0), (down, -1.0) ):
+                if pdos_on_y:
+                    output.write( FormatBlock( energy, sign*pdos[spin, :, orbital] ) )
+                else:
+                    output.write( FormatBlock( sign*pdos[spin, :, orbital], energy ) )
+
+def ExportPDOS ( input_files, output_path=None, pdos_on_y=True ):
+    '''Writes the pDOS <input> as <output_path>.dat. With output_path "-" every
+    input is streamed to stdout; without output_path each input is written as
+    <input>.dat. A single output_path cannot name several inputs'''
+    if output_path not in ( None, "-" ) and len( input_files ) > 1:
+        raise ValueError( "one output {} for {} inputs: leave it out to write each input as <input>.dat, "
+            "or give - for stdout".format( output_path, len( input_files ) ) )
+    for input_file in input_files:
+        data = LoadPDOS( input_file )
+        if output_path == "-":
+            WritePDOS( sys.stdout, data['pdos'], data['eigen_energy'], data['eigen_adjust'], pdos_on_y )
+            continue
+        if output_path is None:
+            target = input_file + '.dat'
+        else:
+            target = output_path + '.dat'
+        with open( target, 'w', buffering=WRITE_BUFFER ) as output:
+            WritePDOS( output, data['pdos'], data['eigen_energy'], data['eigen_adjust'], pdos_on_y )
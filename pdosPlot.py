@@ -3,231 +3,325 @@
 
 Post-processing script for VASP output
 
-Reads plain text .dat files in INPUT_FILE and generates a projected density 
-of states (pDOS) plot with desired dimensions and DPI.
-It uses the LaTeX backend of matplotlib to renderize the eulervm fonts'''
+Generates projected density of states (pDOS) figures from the pDOS outputs
+(see pdosIO.py) described by a JSON figure spec: panels stacked in one
+column sharing the axes, each with its series (spin up and negated spin
+down, optionally hatched in between), Fermi level lines, titles and legend.
+Without a spec the layered Nb figure below (DEFAULT_SPEC) is drawn.
 
+Two modes:
+    * publication (default), the pgf backend with LaTeX rendering the eulervm
+      fonts, written as PDF
+    * draft (-d), the Agg backend with mathtext, written as PNG in a fraction
+      of a second, to iterate on the layout
+Several specs are rendered in parallel worker processes (-n).
+
+Figures are rebuilt incrementally: BUILD_CACHE records, for each figure
+written, the spec and style it was drawn with and the size, mtime and
+SHA-1 of every input array. A figure whose spec, mode and inputs are
+unchanged is skipped (-f forces a rebuild). With -w the specs and their
+inputs are polled every few seconds and only the affected figures are
+redrawn whenever a pDOS output is regenerated.
+
+Spec example (every key but panels is optional):
+{
+    "output": "pdosNblayer",
+    "xlim": [-7, 10], "ylim": [-5, 5], "yticks": [-5, 5],
+    "size": [3.15, 4.86],
+    "xlabel": "Energy (eV)", "ylabel": "pDOS (a.u.)", "ylabel_panel": 1,
+    "fermi": {"input": "NbSurf_eg", "height": "total"},
+    "legend": {"panel": -1, "loc": "lower center", "bbox_to_anchor": [0.5, -1], "ncol": 3},
+    "tag": "(a)",
+    "panels": [
+        {"title": "Surface", "series": [
+            {"input": "NbSurf_eg", "color": "0.3333", "label": "$e_g$", "hatch": "---"},
+            {"input": "total", "color": "black", "label": "Total"}
+        ]}
+    ]
+}
+A series of a separated pDOS selects its column with "orbital": <index>, the
+position in the <partial> column layout ([s py pz px dxy dyz dz2 dxz dx2]
+without energy), whatever orbitals the pDOS was computed for.
+
+Usage: pdosPlot.py [-d] [-f] [-w | --watch=<seconds>] [-n <processes>] [<spec.json> ...]'''
+
+import sys, getopt
+import copy
+import hashlib
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
 import matplotlib as mpl
 import numpy as np
 from matplotlib.backends.backend_pgf import PdfPages
-from matplotlib import rc
-import matplotlib.pyplot as plt
-import matplotlib.style
-
-INPUT_FILE = [
-    'NbSurf_eg', 'NbSurf_t2g',
-    'NbSubsurf_eg', 'NbSubsurf_t2g',
-    'NbBulk_eg', 'NbBulk_t2g',
-    'total'
-]
-OUTPUT_FILE = 'pdosNblayer'
-XLIM = (-7, 10)
-YLIM = (-5, 5)
-DATA = []
-for i in INPUT_FILE:
-    DATA.append(np.load(i+'.npz'))
+from matplotlib.figure import Figure
+from fileCache import FileRecord, IsFresh, ReadJSON, WriteJSON
+from pdosIO import ARRAYS, LoadPDOS, ResolvePDOS, SpinDownIndex
 
 MM2IN = 25.4
 WIDTH = (0.5)*(210.0 - 20.0 - 30.0)/MM2IN
 HEIGHT = (0.5)*(297.0 - 20.0 - 30.0)/MM2IN
+BUILD_CACHE = '.pdos_figures.json'
+WATCH_INTERVAL = 2.0
+
+def Series(input_file, color, label=None, hatch=None):
+    series = {'input': input_file, 'color': color}
+    if label:
+        series['label'] = label
+    if hatch:
+        series['hatch'] = hatch
+    return series
+
+def LayerPanel(title, layer):
+    return {'title': title, 'series': [
+        Series('Nb' + layer + '_eg', '0.3333', r'$e_g$', '---'),
+        Series('Nb' + layer + '_t2g', '0.6667', r'$t_{2g}$', '|||'),
+        Series('total', 'black', 'Total')
+    ]}
+
+DEFAULT_SPEC = {
+    'output': 'pdosNblayer',
+    'xlim': [-7, 10],
+    'ylim': [-5, 5],
+    'yticks': [-5, 5],
+    'size': [WIDTH, HEIGHT],
+    'xlabel': 'Energy (eV)',
+    'ylabel': 'pDOS (a.u.)',
+    'ylabel_panel': 1,
+    'fermi': {'input': 'NbSurf_eg', 'height': 'total'},
+    'legend': {'panel': -1, 'loc': 'lower center', 'bbox_to_anchor': [0.5, -1], 'ncol': 3},
+    'tag': '(a)',
+    'panels': [
+        LayerPanel('Surface', 'Surf'),
+        LayerPanel('Subsurface', 'Subsurf'),
+        LayerPanel('Bulk-like', 'Bulk')
+    ]
+}
+FERMI_STYLE = {'linestyle': 'dashed', 'linewidth': 2.0, 'c': 'red', 'label': r'$\varepsilon_F$'}
+
+RC_COMMON = {
+    'font.family': 'serif',
+    'savefig.dpi': 300,
+    'legend.loc': 'upper right',
+    'legend.frameon': False,
+    'legend.fancybox': False,
+}
+RC_PUBLICATION = {
+    'text.usetex': True,
+    'pgf.rcfonts': False,
+    'pgf.texsystem': 'pdflatex',
+    'pgf.preamble': r'\usepackage{mathpazo,eulervm}\usepackage[utf8x]{inputenc}',
+}
+RC_DRAFT = {
+    'text.usetex': False,
+    'mathtext.fontset': 'cm',
+    'savefig.dpi': 100,
+}
+
+def SpinChannels(data, series):
+    '''Spin up and negated spin down curves of a series; the down curve is
+    None for ISPIN=1 and for a non-collinear run (total curve only)'''
+    pdos = data['pdos']
+    down = SpinDownIndex(pdos)
+    if 'orbital' in series:
+        pdos = pdos[..., series['orbital']]
+    return pdos[0], (-pdos[down] if down is not None else None)
+
+def DrawSeries(ax, data, series):
+    x_axis = data['eigen_energy'] + data['eigen_adjust']
+    up, down = SpinChannels(data, series)
+    ax.plot(x_axis, up, c=series['color'], label=series.get('label'))
+    if down is not None:
+        ax.plot(x_axis, down, c=series['color'])
+    if series.get('hatch'):
+        ax.fill_between(
+            x_axis, up, down if down is not None else 0.0,
+            facecolor='none',
+            edgecolor=series['color'],
+            hatch=series['hatch']
+        )
+
+def DrawFermi(ax, fermi, DATA):
+    '''Vertical line at the Fermi level of fermi['input'], spanning the spin
+    up and down maxima of fermi['height']'''
+    e_fermi = DATA[fermi['input']]['e_fermi']
+    up, down = SpinChannels(DATA[fermi['height']], fermi)
+    bottom = np.amin(down) if down is not None else 0.0
+    style = dict(FERMI_STYLE, **fermi.get('style', {}))
+    ax.plot([e_fermi, e_fermi], [np.amax(up), bottom], **style)
+
+def SpecInputs(spec):
+    inputs = [series['input'] for panel in spec['panels'] for series in panel['series']]
+    if spec.get('fermi'):
+        inputs += [spec['fermi']['input'], spec['fermi']['height']]
+    return list(dict.fromkeys(inputs))
+
+def DrawFigure(spec, DATA):
+    FIG = Figure(figsize=spec.get('size', [WIDTH, HEIGHT]), constrained_layout=True)
+    AXES = FIG.subplots(nrows=len(spec['panels']), ncols=1, sharex=True, sharey=True, squeeze=False)[:, 0]
+    for ax, panel in zip(AXES, spec['panels']):
+        for series in panel['series']:
+            DrawSeries(ax, DATA[series['input']], series)
+        if spec.get('fermi'):
+            DrawFermi(ax, spec['fermi'], DATA)
+        if panel.get('title'):
+            ax.set_title(panel['title'])
+
+    limits = {key: spec[key] for key in ('xlim', 'ylim', 'yticks') if key in spec}
+    AXES[-1].set(xlabel=spec.get('xlabel', 'Energy (eV)'), **limits)
+    AXES[min(spec.get('ylabel_panel', len(AXES)//2), len(AXES) - 1)].set(ylabel=spec.get('ylabel', 'pDOS (a.u.)'))
+    if spec.get('legend') is not None:
+        legend = dict(spec['legend'])
+        AXES[legend.pop('panel', -1)].legend(**legend)
+    if spec.get('tag'):
+        FIG.text(0.01, 0.95, spec['tag'])
+    return FIG
+
+def RenderFigure(spec, draft=False):
+    '''Draws spec and writes <output>.pdf (publication) or <output>.png (draft);
+    returns the path written'''
+    DATA = {input_file: LoadPDOS(input_file) for input_file in SpecInputs(spec)}
+    rc = dict(RC_COMMON, **(RC_DRAFT if draft else RC_PUBLICATION))
+    rc.update(spec.get('rc', {}))
+    with mpl.rc_context(rc):
+        FIG = DrawFigure(spec, DATA)
+        output_path = OutputPath(spec, draft)
+        if draft:
+            FIG.savefig(output_path)
+        else:
+            with PdfPages(output_path) as OUTPUT:
+                OUTPUT.savefig(FIG)
+    return output_path
+
+def RenderTask(spec, draft=False):
+    '''Pool task: never raises, the error is returned in the report'''
+    start = time.time()
+    report = {'output': spec.get('output'), 'path': None, 'error': None}
+    try:
+        report['path'] = RenderFigure(spec, draft)
+    except Exception:
+        report['error'] = traceback.format_exc()
+    report['seconds'] = time.time() - start
+    return report
+
+def OutputPath(spec, draft=False):
+    return spec.get('output', 'pdos') + ('.png' if draft else '.pdf')
+
+def StyleDigest(spec, draft=False):
+    '''SHA-1 of everything that changes the drawing besides the input data'''
+    style = {'spec': spec, 'draft': draft, 'rc': dict(RC_COMMON, **(RC_DRAFT if draft else RC_PUBLICATION))}
+    return hashlib.sha1(json.dumps(style, sort_keys=True).encode()).hexdigest()
+
+def InputFiles(spec):
+    '''Files holding the pDOS outputs read by spec'''
+    files = []
+    for input_file in SpecInputs(spec):
+        path = ResolvePDOS(input_file)
+        files += [os.path.join(path, name + '.npy') for name in ARRAYS] if path.endswith('.pdos') else [path]
+    return files
+
+def IsUpToDate(spec, draft, entry):
+    '''True if the figure of spec was drawn from the same spec, mode and inputs'''
+    if entry is None or not os.path.exists(OutputPath(spec, draft)):
+        return False
+    if entry['style'] != StyleDigest(spec, draft):
+        return False
+    try:
+        files = InputFiles(spec)
+    except FileNotFoundError:
+        return False
+    return sorted(files) == sorted(entry['inputs']) and all(IsFresh(path, entry['inputs'][path]) for path in files)
+
+def RenderAll(specs, draft=False, processes=None, force=False, verbose=True):
+    '''Renders the specs whose figure is missing or stale, in parallel when
+    there is more than one; returns the reports of the figures drawn'''
+    cache = ReadJSON(BUILD_CACHE) or {}
+    stale = [spec for spec in specs if force or not IsUpToDate(spec, draft, cache.get(OutputPath(spec, draft)))]
+    for spec in specs:
+        if verbose and spec not in stale:
+            print("{}: up to date".format(spec.get('output')))
+    # Inputs are recorded before drawing, so a file rewritten meanwhile triggers another build
+    entries = {}
+    for spec in stale:
+        try:
+            entries[OutputPath(spec, draft)] = {'style': StyleDigest(spec, draft),
+                'inputs': {path: FileRecord(path) for path in InputFiles(spec)}}
+        except FileNotFoundError:
+            pass
+
+    if len(stale) <= 1 or processes == 1:
+        reports = [RenderTask(spec, draft) for spec in stale]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [pool.submit(RenderTask, spec, draft) for spec in stale]
+            reports = [future.result() for future in futures]
+    for report in reports:
+        status = report['path'] if not report['error'] else "failed"
+        print("{}: {} ({:.1f} s)".format(report['output'], status, report['seconds']))
+        if report['error']:
+            print(report['error'], file=sys.stderr)
+        elif report['path'] in entries:
+            cache[report['path']] = entries[report['path']]
+    if reports:
+        WriteJSON(BUILD_CACHE, cache)
+    return reports
+
+def LoadSpecs(spec_paths):
+    specs = []
+    for spec_path in spec_paths:
+        with open(spec_path) as source:
+            specs.append(json.load(source))
+    return specs or [copy.deepcopy(DEFAULT_SPEC)]
+
+def Watch(spec_paths, draft=False, processes=None, interval=WATCH_INTERVAL):
+    '''Rebuilds the affected figures whenever a spec or an input changes, until interrupted'''
+    print("watching {} (Ctrl-C to stop)".format(", ".join(spec_paths) or "the default figure"))
+    try:
+        while True:
+            try:
+                RenderAll(LoadSpecs(spec_paths), draft, processes, verbose=False)
+            except ValueError as error:
+                # A spec saved half way through an edit
+                print("invalid spec: {}".format(error), file=sys.stderr)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+def main(argv):
+    usage = "pdosPlot.py [-d] [-f] [-w | --watch=<seconds>] [-n <processes>] [<spec.json> ...]"
+    try:
+        opts, args = getopt.getopt(argv, "hdfwn:", ["draft", "force", "watch=", "processes="])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+
+    draft = False
+    force = False
+    watch = None
+    processes = None
+    for opt, arg in opts:
+        if opt == "-h":
+            print(usage)
+            sys.exit()
+        elif opt in ("-d", "--draft"):
+            draft = True
+        elif opt in ("-f", "--force"):
+            force = True
+        elif opt == "-w":
+            watch = WATCH_INTERVAL
+        elif opt == "--watch":
+            watch = float(arg)
+        elif opt in ("-n", "--processes"):
+            processes = int(arg)
+
+    if watch:
+        Watch(args, draft, processes, watch)
+        return
+    reports = RenderAll(LoadSpecs(args), draft, processes, force)
+    if any(report['error'] for report in reports):
+        sys.exit(1)
 
-"""
-INPUT_DATA is a pickled, compressed file with the following numpy arrays:
-    * pdos, an np.array, with dimensions (ispin, numpoints), where ispin=2 and numpoints=301 (default from VASP)
-    * eigen_energy, an np.array, with dimensions (numpoints)
-    * eigen_adjust, a float
-    * e_fermi, a float
-"""
-with PdfPages(OUTPUT_FILE+'.pdf') as OUTPUT:
-    plt.rcParams.update({
-        'font.family': 'serif',
-        'figure.figsize': [WIDTH, HEIGHT],
-        'savefig.dpi': 300,
-        'text.usetex': True,
-        'pgf.rcfonts': False,
-        'pgf.texsystem': 'pdflatex',
-        'pgf.preamble': [r'\usepackage{mathpazo,eulervm}\usepackage[utf8x]{inputenc}'],
-        'legend.loc': 'upper right',
-        'legend.frameon': False,
-        'legend.fancybox': False,
-    })
-    FIG, (AX0, AX1, AX2) = plt.subplots(
-        nrows=3,
-        ncols=1,
-        sharex=True,
-        sharey=True,
-        constrained_layout=True
-    )
-    x_axis = DATA[0]['eigen_energy'] + DATA[0]['eigen_adjust']
-# Surface
-    AX0.plot(
-        x_axis,  DATA[0]['pdos'][0, ...],
-        x_axis, -DATA[0]['pdos'][1, ...],
-        c='0.3333',
-        label=r'$e_g$'
-    )
-
-    AX0.fill_between(
-        x_axis, DATA[0]['pdos'][0, ...], -DATA[0]['pdos'][1, ...],
-        facecolor='none',
-        edgecolor='0.3333',
-        hatch='---'
-    )
-
-    AX0.plot(
-        x_axis,  DATA[1]['pdos'][0, ...],
-        x_axis, -DATA[1]['pdos'][1, ...],
-        c='0.6667',
-        label=r'$t_{2g}$'
-    )
-
-    AX0.fill_between(
-        x_axis, DATA[1]['pdos'][0, ...], -DATA[1]['pdos'][1, ...],
-        facecolor='none',
-        edgecolor='0.6667',
-        hatch='|||'
-    )
-
-    AX0.plot(
-        x_axis,  DATA[-1]['pdos'][0, ...],
-        x_axis, -DATA[-1]['pdos'][1, ...],
-        c='black',
-        label='Total'
-    )
-
-    AX0.plot(
-        [DATA[0]['e_fermi'], DATA[0]['e_fermi']],
-        [np.amax(DATA[-1]['pdos'][0, ...]), -np.amax(DATA[-1]['pdos'][1, ...])],
-        linestyle='dashed',
-        linewidth=2.0,
-        c='red',
-        label=r'$\varepsilon_F$'
-    )
-    
-    AX0.set_title('Surface')
-# Subsurface
-    AX1.plot(
-        x_axis,  DATA[2]['pdos'][0, ...],
-        x_axis, -DATA[2]['pdos'][1, ...],
-        c='0.3333',
-        label=r'$e_g$'
-    )
-
-    AX1.fill_between(
-        x_axis, DATA[2]['pdos'][0, ...], -DATA[2]['pdos'][1, ...],
-        facecolor='none',
-        edgecolor='0.3333',
-        hatch='---'
-    )
-
-    AX1.plot(
-        x_axis,  DATA[3]['pdos'][0, ...],
-        x_axis, -DATA[3]['pdos'][1, ...],
-        c='0.6667',
-        label=r'$t_{2g}$'
-    )
-
-    AX1.fill_between(
-        x_axis, DATA[3]['pdos'][0, ...], -DATA[3]['pdos'][1, ...],
-        facecolor='none',
-        edgecolor='0.6667',
-        hatch='|||'
-    )
-
-    AX1.plot(
-        x_axis,  DATA[-1]['pdos'][0, ...],
-        x_axis, -DATA[-1]['pdos'][1, ...],
-        c='black',
-        label='Total'
-    )
-    
-    AX1.plot(
-        [DATA[0]['e_fermi'], DATA[0]['e_fermi']],
-        [np.amax(DATA[-1]['pdos'][0, ...]), -np.amax(DATA[-1]['pdos'][1, ...])],
-        linestyle='dashed',
-        linewidth=2.0,
-        c='red',
-        label=r'$\varepsilon_F$'
-    )
-
-    AX1.set_title('Subsurface')
-# Bulk
-    AX2.plot(
-        x_axis,  DATA[4]['pdos'][0, ...],
-        c='0.3333',
-        label=r'$e_g$'
-    )
-
-    AX2.plot(
-        x_axis, -DATA[4]['pdos'][1, ...],
-        c='0.3333'
-    )
-
-    AX2.fill_between(
-        x_axis, DATA[4]['pdos'][0, ...], -DATA[4]['pdos'][1, ...],
-        facecolor='none',
-        edgecolor='0.3333',
-        hatch='---'
-    )
-
-    AX2.plot(
-        x_axis,  DATA[5]['pdos'][0, ...],
-        c='0.6667',
-        label=r'$t_{2g}$'
-    )
-
-    AX2.plot(
-        x_axis, -DATA[5]['pdos'][1, ...],
-        c='0.6667'
-    )
-
-    AX2.fill_between(
-        x_axis, DATA[5]['pdos'][0, ...], -DATA[5]['pdos'][1, ...],
-        facecolor='none',
-        edgecolor='0.6667',
-        hatch='|||'
-    )
-
-    AX2.plot(
-        x_axis,  DATA[-1]['pdos'][0, ...],
-        c='black',
-        label='Total'
-    )
-
-    AX2.plot(
-        x_axis, -DATA[-1]['pdos'][1, ...],
-        c='black'
-    )
-
-    AX2.plot(
-        [DATA[0]['e_fermi'], DATA[0]['e_fermi']],
-        [np.amax(DATA[-1]['pdos'][0, ...]), -np.amax(DATA[-1]['pdos'][1, ...])],
-        linestyle='dashed',
-        linewidth=2.0,
-        c='red',
-        label=r'$\varepsilon_F$'
-    )
-
-    AX2.set_title('Bulk-like')
-
-    for i in DATA:
-        i.close()
-
-    AX2.set(
-        xlabel='Energy (eV)',
-        xlim=XLIM,
-        ylim=YLIM,
-        yticks=[-5, 5]
-    )
-
-    AX1.set(ylabel='pDOS (a.u.)')
-
-    AX2.legend(
-        loc='lower center',
-        bbox_to_anchor=(0.5, -1),
-        ncol=3
-    )
-
-    plt.figtext(0.01, 0.95, '(a)')
-
-    OUTPUT.savefig()
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Post-processing script for VASP output
+
+Batch version of pdosSum.py and pdosSeparated.py: the partial DOS is read
+once and every selection listed in a JSON recipe is computed from the same
+in-memory tensor, writing one pDOS output (see pdosIO.py) per selection.
+
+Recipe example:
+{
+    "sigma": 0.1,
+    "eigen_adjust": 0.0,
+    "selections": [
+        {"name": "NbSurf_eg", "ions": ["69-72", 82], "orbitals": [0, 0, 0, 0, 0, 0, 1, 0, 1]},
+        {"name": "Nb_bulk_separated_d", "ions": [73, 86], "orbitals": [0, 0, 0, 0, 1, 1, 1, 1, 1],
+         "separated": true},
+        {"name": "total", "ions": [1, 86], "orbitals": [1, 1, 1, 1, 1, 1, 1, 1, 1]}
+    ]
+}
+orbitals can also list column names of the vasprun.xml <field> headers
+(["d"], ["dz2", "dx2"], {"dz2": 1.0, "dx2": 0.5}, see pdosSelection.py) and
+ion_weights gives one (possibly fractional) weight per ion of a selection.
+sigma, kernel, cutoff, eigen_adjust, numpoints (default NEDOS) and format
+('npz', the default, or 'npy') can be set globally or per selection, and
+so can orbitals. Every selection needs a name and ions: a recipe missing any
+of these is refused with a ValueError naming the selection.
+
+Usage: pdosRecipe.py -r <recipe.json> [-i <vasprun.xml>] [-o <output directory>]'''
+
+import sys, getopt
+import json
+import os
+import numpy as np
+from broadening import Broaden
+from pdosCache import LoadPartialDOS
+from pdosIO import DEFAULT_FORMAT, SavePDOS
+from pdosSelection import ParseIons, SelectPDOS
+
+DEFAULTS = {
+    'sigma': 0.1,
+    'kernel': 'gaussian',
+    'cutoff': None,
+    'eigen_adjust': 0.0,
+    'numpoints': None,
+    'format': DEFAULT_FORMAT,
+    'separated': False,
+    'ion_weights': None
+}
+
+def ValidateRecipe ( recipe ):
+    '''Raises ValueError naming the first selection of recipe lacking a
+    name, ions or orbitals, before anything is read'''
+    selections = recipe.get( 'selections' ) if isinstance( recipe, dict ) else None
+    if not isinstance( selections, list ) or not selections:
+        raise ValueError( "the recipe should hold a non-empty list of selections" )
+    names = set()
+    for index, selection in enumerate( selections, start=1 ):
+        if not isinstance( selection, dict ):
+            raise ValueError( "selection {} of the recipe is not an object".format( index ) )
+        label = "selection {}".format( index )
+        if 'name' in selection:
+            label += " ({})".format( selection['name'] )
+        missing = [key for key in ( 'name', 'ions' ) if key not in selection]
+        if 'orbitals' not in selection and 'orbitals' not in recipe:
+            missing.append( 'orbitals' )
+        if missing:
+            raise ValueError( "{} of the recipe has no {}".format( label, ", ".join( missing ) ) )
+        if selection['name'] in names:
+            raise ValueError( "{} of the recipe repeats the name of an earlier selection".format( label ) )
+        names.add( selection['name'] )
+
+def RunRecipe ( recipe, vasprun_path='vasprun.xml', output_dir='.', verbose=True ):
+    '''Computes every selection of recipe (a dict, see the module docstring)
+    from a single read of vasprun_path. Returns the written paths.'''
+    ValidateRecipe( recipe )
+    selections = recipe['selections']
+    ion_lists = [ParseIons( selection['ions'] ) for selection in selections]
+    ion_union = np.unique( np.concatenate( ion_lists ) )
+
+    vasprun = LoadPartialDOS( vasprun_path, ion_union, verbose )
+    pdos_raw = vasprun['pdos_raw']
+    energy = pdos_raw[0, 0, :, 0]
+
+    written = []
+    for selection, ion_list in zip( selections, ion_lists ):
+        settings = dict( DEFAULTS )
+        settings.update( {key: value for key, value in recipe.items() if key != 'selections'} )
+        settings.update( selection )
+        if verbose:
+            print( "computing selection {} ({} ions)".format( selection['name'], len( ion_list ) ) )
+
+        numpoints = settings['numpoints'] or vasprun['nedos']
+        eigen_energy = np.linspace( energy[0], energy[-1], numpoints )
+        pdos = SelectPDOS(
+            pdos_raw[np.searchsorted( ion_union, ion_list )],
+            settings['orbitals'], settings['separated'],
+            vasprun['fields'], settings['ion_weights']
+        )
+        pdos_gaussian = Broaden(
+            energy, pdos, eigen_energy,
+            settings['sigma'], settings['kernel'], settings['cutoff'],
+            axis=1
+        )
+
+        written.append( SavePDOS(
+            os.path.join( output_dir, selection['name'] ),
+            pdos_gaussian, eigen_energy, settings['eigen_adjust'], vasprun['efermi'],
+            settings['format']
+            ))
+    return written
+
+def main( argv ):
+    try:
+        opts, args = getopt.getopt( argv, "hr:i:o:", ["recipe=", "in=", "out="] )
+    except getopt.GetoptError:
+        print( "pdosRecipe.py -r <recipe.json> -i <vasprun.xml> -o <output directory>" )
+        sys.exit(2)
+
+    recipe_path = None
+    vasprun_path = 'vasprun.xml'
+    output_dir = '.'
+    for opt, arg in opts:
+        if opt == "-h":
+            print( "pdosRecipe.py -r <recipe.json> -i <vasprun.xml> -o <output directory>" )
+            sys.exit()
+        elif opt in ( "-r", "--recipe" ):
+            recipe_path = arg
+        elif opt in ( "-i", "--in" ):
+            vasprun_path = arg
+        elif opt in ( "-o", "--out" ):
+            output_dir = arg
+
+    if recipe_path is None:
+        print( "a recipe should be given with -r <recipe.json>" )
+        sys.exit(2)
+    with open( recipe_path ) as source:
+        recipe = json.load( source )
+    try:
+        ValidateRecipe( recipe )
+    except ValueError as error:
+        print( "{}: {}".format( recipe_path, error ) )
+        sys.exit(2)
+    os.makedirs( output_dir, exist_ok=True )
+    for output_path in RunRecipe( recipe, vasprun_path, output_dir ):
+        print( "writing PDOS on file " + output_path )
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Ion and orbital selections over the partial DOS tensor
+
+ParseIons turns the ion declarations used by the recipes into an explicit
+ion list. OrbitalWeights turns an orbital declaration into one weight per
+column of the <partial> block, whose layout is taken from its <field>
+headers (s p d, lm-decomposed s py pz px dxy ..., with or without the 16
+f columns). SelectPDOS contracts the ion and orbital axes with those weights
+in a single einsum, for any number of spin components (1, 2 or the 4 of a
+non-collinear run).'''
+
+import numpy as np
+from instrumentation import Stage
+from vasprunReader import ExpandIonList
+
+# Columns of the partial DOS when the <field> headers are not available
+DEFAULT_FIELDS = ['energy', 's', 'py', 'pz', 'px', 'dxy', 'dyz', 'dz2', 'dxz', 'dx2']
+# VASP 5.4.4 and later name the last d column x2-y2
+ALIASES = {'dx2': 'x2-y2', 'x2-y2': 'dx2'}
+# Columns of each shell, in the spd and in the lm-decomposed layouts
+SHELLS = {
+    's': ['s'],
+    'p': ['p', 'py', 'pz', 'px'],
+    'd': ['d', 'dxy', 'dyz', 'dz2', 'dxz', 'dx2', 'x2-y2'],
+    'f': ['f', 'fy3x2', 'fxyz', 'fyz2', 'fz3', 'fxz2', 'fzx2', 'fx3']
+}
+
+def ParseIons ( ions ):
+    '''Explicit 1-based ion list from a declaration.
+    [first, last] keeps the convention of the scripts (a sequence of atoms);
+    any other list is taken literally, and its items can also be "first-last"
+    strings, e.g. ["1-10", 15, "20-22"].'''
+    if isinstance( ions, str ):
+        ions = [ions]
+    if all( not isinstance( i, str ) for i in ions ):
+        return ExpandIonList( ions )
+    ion_list = []
+    for item in ions:
+        if isinstance( item, str ) and '-' in item:
+            first, last = item.split( '-' )
+            ion_list.extend( range( int( first ), int( last ) + 1 ) )
+        else:
+            ion_list.append( int( item ) )
+    return np.array( ion_list, dtype=int )
+
+def OrbitalWeights ( orbitals, fields=None ):
+    '''Weight of each orbital column (fields without 'energy').
+    orbitals can be
+        * a list of numbers, one per column, e.g. the [s py pz px dxy dyz dz2 dxz dx2]
+          mask; fractional weights are allowed
+        * a list of column names, where 's', 'p', 'd' and 'f' also stand for
+          every column of that shell (SHELLS), 'all' for every column and
+          'dx2' and 'x2-y2' for each other
+        * a dict {name: weight} with the same names'''
+    names = list( fields or DEFAULT_FIELDS )[1:]
+    if isinstance( orbitals, dict ):
+        declared = orbitals.items()
+    elif len( orbitals ) and all( isinstance( orbital, str ) for orbital in orbitals ):
+        declared = [(orbital, 1.0) for orbital in orbitals]
+    else:
+        weights = np.asarray( orbitals, dtype=float )
+        if weights.shape != (len( names ),):
+            raise ValueError( "orbitals should have one weight per column of {}, not {}".format( names, len( weights ) ) )
+        return weights
+
+    weights = np.zeros( len( names ) )
+    for orbital, weight in declared:
+        if orbital in names:
+            columns = [names.index( orbital )]
+        elif ALIASES.get( orbital ) in names:
+            columns = [names.index( ALIASES[orbital] )]
+        elif orbital == 'all':
+            columns = range( len( names ) )
+        else:
+            columns = [column for column, name in enumerate( names ) if name in SHELLS.get( orbital, () )]
+        if not columns:
+            raise ValueError( "orbital {} is not one of the columns {}".format( orbital, names ) )
+        weights[list( columns )] = weight
+    return weights
+
+def SelectPDOS ( pdos_raw, orbitals, separated=False, fields=None, ion_weights=None ):
+    '''pdos_raw, an np.array with dimensions (ion, spin, nedos, 1+orbitals),
+    holding only the selected ions
+    orbitals, see OrbitalWeights
+    ion_weights, one weight per ion of pdos_raw (default 1)
+
+    Returns the weighted sum over ions and orbitals, with dimensions
+    (spin, nedos), or (spin, nedos, orbitals) if separated, in the column
+    layout of pdos_raw so that an orbital index keeps its meaning whatever
+    the selection; only the orbitals with a nonzero weight are computed, the
+    others are left at zero.'''
+    weights = OrbitalWeights( orbitals, fields )
+    if ion_weights is None:
+        ion_weights = np.ones( pdos_raw.shape[0] )
+    selected = np.flatnonzero( weights ) + 1
+    with Stage( 'orbital_summation', items=pdos_raw.shape[0]*len( selected ) ):
+        columns = pdos_raw[..., selected]
+        if separated:
+            pdos = np.zeros( pdos_raw.shape[1:3] + (len( weights ),) )
+            pdos[..., selected - 1] = np.einsum( 'i,isek,k->sek', ion_weights, columns, weights[selected - 1], optimize=True )
+            return pdos
+        return np.einsum( 'i,isek,k->se', ion_weights, columns, weights[selected - 1], optimize=True )
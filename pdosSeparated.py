@@ -7,82 +7,41 @@ It extracts the electronic state's projection on each atom and orbital.
 It sums over the declared number of atoms but not over the declared orbitals.
 At the end, the script changes the Dirac-delta-like states into Gaussian-like
 and builds the Y (or X) array.
-The output is a pickled .npz file.'''
+The output is a pickled, compressed .npz file (output_format = 'npz') or,
+opt-in, a directory of memory-mappable .npy files (output_format = 'npy').'''
 
-import xml.etree.ElementTree as et
 import numpy as np
+from broadening import Broaden
+from pdosCache import LoadPartialDOS
+from pdosIO import SavePDOS
+from pdosSelection import SelectPDOS
+from vasprunReader import ExpandIonList
 
-def Gaussian ( x, mu, sigma, height ):
-    return height*np.exp( -0.5*np.power( (x - mu)/sigma, 2 ) )
-
-def OrbSum ( dos, orb ):
-    acc = np.zeros( dos.shape[:-1] )
-    array_iterator = np.nditer( orb, flags=['f_index'] )
-    while not array_iterator.finished:
-        if array_iterator.value == 0:
-            array_iterator.iternext()
-        else:
-            for spin in range( dos.shape[0] ):
-                acc[spin, ...] += dos[spin, ..., array_iterator.iterindex]
-            array_iterator.iternext()
-    return acc
-
-vasprun_root = et.parse( 'vasprun.xml' ).getroot()
 # A sequence of atoms can be evaluated by declaring the first and last atom
 # A list of atoms in any order can be evaluated by explicitly declaring each one
 ion_list = np.array( [73, 74, 75, 76, 77, 78, 79, 80, 81, 83] )
 orbitals = np.array( [0, 0, 0, 0, 1,  1,  1,  1,  1] )
 #                    [s  py pz px dxy dyz dz2 dxz dx2]
+# or names of the vasprun.xml <field> columns, e.g. ['d'] or {'dz2': 1, 'dx2': 0.5}
 eigen_adjust = 0.0
 pdos_on_y = True
 output_path = "./Nb_bulk_separated_d"
+# 'npz', or 'npy' for the memory-mappable <output_path>.pdos directory
+output_format = 'npz'
 sigma = 0.1
-ispin = int( vasprun_root.find( './/*[@name="ISPIN"]' ).text )
-nedos = int( vasprun_root.find( './/*[@name="NEDOS"]' ).text )
-e_fermi = float( vasprun_root.find( './/*[@name="efermi"]' ).text )
+# 'gaussian', 'lorentzian' or 'pseudo-voigt'; states beyond cutoff*sigma are neglected
+kernel = 'gaussian'
+cutoff = None
+ion_list = ExpandIonList( ion_list )
+vasprun = LoadPartialDOS( 'vasprun.xml', ion_list )
+pdos_raw = vasprun['pdos_raw']
+nedos = vasprun['nedos']
+e_fermi = vasprun['efermi']
 numpoints = nedos
 
-if len( ion_list ) == 2:
-    ion_list = np.arange( ion_list[0], ion_list[1] + 1 )
-
-pdos_raw = np.empty( (len( ion_list ), ispin, nedos, len( orbitals ) + 1) )
-ion_iterator = np.nditer( ion_list, flags=['f_index'] )
-
-while not ion_iterator.finished:
-    print( "extracting data from ion {} ({}/{})".format( np.array2string( ion_iterator.value ), ion_iterator.iterindex + 1, ion_iterator.itersize ) )
-    for spin in range( ispin ):
-        for numdos in range( nedos ):
-            pdos_raw[ion_iterator.iterindex, spin, numdos] = np.fromstring( vasprun_root.find( './/partial/array/set' )[ion_iterator[0] - 1][spin][numdos].text, sep=' ' )
-    ion_iterator.iternext()
-
-vasprun_root.clear()
-
-orb_iterator = np.nditer( orbitals, flags=['f_index'] )
-acc = np.zeros( (ispin, nedos, len( orbitals )) )
 eigen_energy = np.linspace( pdos_raw[0, 0, 0, 0], pdos_raw[0, 0, -1, 0], numpoints )
 
-while not orb_iterator.finished:
-    if orb_iterator.value == 0:
-        orb_iterator.iternext()
-    else:
-        for ion in range( len( ion_list ) ):
-            print( "summing orbital #{} of ion {}/{}".format( orb_iterator.iterindex + 1, ion + 1, len( ion_list ) ) )
-            for spin in range( ispin ):
-                acc[spin, ..., orb_iterator.iterindex] += pdos_raw[ion, spin, :, orb_iterator.iterindex + 1]
-        orb_iterator.iternext()
-
-#pdos_sum = OrbSum( acc, orbitals )
-#pdos_gaussian = np.zeros( (ispin, numpoints) )
-pdos_gaussian = np.zeros( (ispin, numpoints, acc.shape[2]) )
-for orbital in range( acc.shape[2] ):
-    for spin in range( ispin ):
-        for numdos in range( acc.shape[1] ):
-            pdos_gaussian[spin, ..., orbital] += Gaussian( eigen_energy, pdos_raw[0, spin, numdos, 0], sigma, acc[spin, numdos, orbital] )
+acc = SelectPDOS( pdos_raw, orbitals, separated=True, fields=vasprun['fields'] )
+pdos_gaussian = Broaden( pdos_raw[0, 0, :, 0], acc, eigen_energy, sigma, kernel, cutoff, axis=1 )
 
-np.savez_compressed(
-    output_path+'.npz',
-    pdos=pdos_gaussian,
-    eigen_energy=eigen_energy,
-    eigen_adjust=eigen_adjust,
-    e_fermi=e_fermi
-    )
\ No newline at end of file
+SavePDOS( output_path, pdos_gaussian, eigen_energy, eigen_adjust, e_fermi, output_format )
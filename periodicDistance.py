@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Interatomic vectors and distances under periodic boundary conditions
+
+Positions are fractional (Direct) coordinates and the lattice has the
+lattice vectors as rows, as in POSCAR/CONTCAR files, so a fractional vector
+f is the cartesian vector f @ lattice.
+
+PairVectors gives the minimum image vectors of a list of pairs in one
+batched calculation, valid for any triclinic cell: the fractional difference
+is wrapped into [-0.5, 0.5) and the 27 neighbouring images are compared.
+NeighbourPairs finds every pair closer than a cutoff with a cell list, so
+the cost grows linearly with the number of atoms; small cells fall back to
+an explicit search over periodic images.'''
+
+import itertools
+import numpy as np
+
+IMAGES = np.array( list( itertools.product( (-1, 0, 1), repeat=3 ) ) )
+
+def PlaneSpacings ( lattice ):
+    '''Distance between the lattice planes spanned by each pair of lattice vectors'''
+    return 1.0/np.linalg.norm( np.linalg.inv( lattice ), axis=0 )
+
+def MinimumImage ( frac_delta, lattice ):
+    '''Cartesian minimum image vectors of fractional differences with
+    dimensions (..., 3)'''
+    frac_delta = np.asarray( frac_delta, dtype=float )
+    wrapped = frac_delta - np.round( frac_delta )
+    # In skewed cells the wrapped vector is not always the shortest one
+    candidates = (wrapped[..., np.newaxis, :] + IMAGES) @ lattice
+    shortest = np.argmin( np.einsum( '...ij,...ij->...i', candidates, candidates ), axis=-1 )
+    return np.take_along_axis( candidates, shortest[..., np.newaxis, np.newaxis], axis=-2 )[..., 0, :]
+
+def PairVectors ( frac, lattice, pairs ):
+    '''frac, an np.array with dimensions (atoms, 3) or (frames, atoms, 3)
+    lattice, (3, 3), or (frames, 1, 3, 3) for a cell that changes per frame
+    pairs, 0-based atom indices with dimensions (npairs, 2)
+
+    Returns the minimum image vectors from pairs[:, 0] to pairs[:, 1], with
+    dimensions (..., npairs, 3), and their lengths.'''
+    frac = np.asarray( frac, dtype=float )
+    pairs = np.asarray( pairs, dtype=int )
+    vectors = MinimumImage( frac[..., pairs[:, 1], :] - frac[..., pairs[:, 0], :], lattice )
+    return vectors, np.linalg.norm( vectors, axis=-1 )
+
+def NeighbourPairs ( frac, lattice, cutoff, subset=None ):
+    '''Every pair of atoms (i < j, both in subset if given) closer than cutoff,
+    counting each periodic image of j once.
+
+    Returns i, j (0-based), the lattice translation of the image of j, the
+    cartesian vectors from i to that image and the distances.'''
+    frac = np.asarray( frac, dtype=float )
+    atoms = np.arange( len( frac ) ) if subset is None else np.asarray( subset, dtype=int )
+    wrapped = frac[atoms] - np.floor( frac[atoms] )
+    bins = np.floor( PlaneSpacings( lattice )/cutoff ).astype( int )
+
+    if np.all( bins >= 3 ):
+        first, second, shift = CellListCandidates( wrapped, bins )
+    else:
+        first, second, shift = ImageCandidates( len( atoms ), PlaneSpacings( lattice ), cutoff )
+
+    vectors = (wrapped[second] + shift - wrapped[first]) @ lattice
+    distances = np.linalg.norm( vectors, axis=-1 )
+    close = distances < cutoff
+    # Translation of j relative to its unwrapped position
+    shift = shift[close] - np.floor( frac[atoms[second[close]]] ).astype( int ) + np.floor( frac[atoms[first[close]]] ).astype( int )
+    return atoms[first[close]], atoms[second[close]], shift, vectors[close], distances[close]
+
+def CellListCandidates ( wrapped, bins ):
+    '''Candidate pairs between atoms of neighbouring cells, with at least
+    3 cells along each lattice vector so that no image is counted twice'''
+    cell = np.minimum( (wrapped*bins).astype( int ), bins - 1 )
+    cell_id = np.ravel_multi_index( cell.T, bins )
+    order = np.argsort( cell_id, kind='stable' )
+    counts = np.bincount( cell_id, minlength=np.prod( bins ) )
+    starts = np.concatenate( ([0], np.cumsum( counts )[:-1]) )
+
+    first, second, shift = [], [], []
+    for offset in IMAGES:
+        neighbour = cell + offset
+        image = np.floor_divide( neighbour, bins )
+        neighbour_id = np.ravel_multi_index( (neighbour - image*bins).T, bins )
+        size = counts[neighbour_id]
+        atom_i = np.repeat( np.arange( len( wrapped ) ), size )
+        # Position of each candidate inside its neighbour cell
+        within = np.arange( size.sum() ) - np.repeat( np.cumsum( size ) - size, size )
+        atom_j = order[np.repeat( starts[neighbour_id], size ) + within]
+        keep = atom_i < atom_j
+        first.append( atom_i[keep] )
+        second.append( atom_j[keep] )
+        shift.append( image[atom_i[keep]] )
+    return np.concatenate( first ), np.concatenate( second ), np.concatenate( shift )
+
+def ImageCandidates ( natoms, spacings, cutoff ):
+    '''Every pair against every image that can be closer than cutoff (small cells)'''
+    reach = np.ceil( cutoff/spacings ).astype( int ) + 1
+    images = np.array( list( itertools.product( *( range( -r, r + 1 ) for r in reach ) ) ) )
+    i, j = np.triu_indices( natoms )
+    first = np.repeat( i, len( images ) )
+    second = np.repeat( j, len( images ) )
+    shift = np.tile( images, (len( i ), 1) )
+    # An atom and its own image: keep one of each +/- translation
+    positive = np.array( [tuple( image ) > (0, 0, 0) for image in images] )
+    keep = (first != second) | np.tile( positive, len( i ) )
+    return first[keep], second[keep], shift[keep]
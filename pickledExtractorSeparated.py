@@ -4,14 +4,16 @@
 Post-processing script for VASP output
 
 It extracts the pickled .npz in a plain text .dat file with formatted columns
-and writes each orbital in blocks separated by \\n''
+and writes each orbital in blocks separated by \\n
+Several inputs can be given with repeated -i, each written as <input>.dat
+(a single -o name is refused), and "-o -" streams to stdout'''
 
 import sys, getopt
-import numpy as np
+from pdosIO import ExportPDOS
 
 def main( argv ):
-    output_path = ""
-    input_file = ""
+    output_path = None
+    input_files = []
     pdos_on_y = True
 
     try:
@@ -21,10 +23,10 @@ def main( argv ):
         sys.exit(2)
     for opt, arg in opts:
         if opt == "-h":
-            print( "pickled_extractor.py -i <input> -o <output>" )
+            print( "pickled_extractor.py -i <input> [-i <input> ...] -o <output, - for stdout>" )
             sys.exit()
         elif opt in ( "-i", "--in" ):
-            input_file = arg
+            input_files.append( arg )
         elif opt in ( "-o", "--out" ):
             output_path = arg
         elif opt in ( "-p", "--pdos_on_y" ):
@@ -36,56 +38,14 @@ def main( argv ):
                 print( "-p should be either <True> or <False>" )
                 sys.exit()
 
-    pdos_gaussian = np.load( input_file + ".npz" )['pdos']
-    eigen_energy = np.load( input_file + ".npz" )['eigen_energy']
-    eigen_adjust = np.load( input_file + ".npz" )['eigen_adjust']
-#   eigen_adjust = 2.184686
-
-    with open( output_path+'.dat', 'w' ) as output:
-        if pdos_on_y == True:
-            for orbital in range( pdos_gaussian.shape[2] ):
-                for numdos in range( pdos_gaussian.shape[1] ):
-                    output.write( "{:f} {:f}\n".format(
-                        eigen_energy[numdos] + eigen_adjust,
-                        pdos_gaussian[0, numdos, orbital]
-                        ))
-                output.write( "\n" )
-        
-                if pdos_gaussian.shape[0] == 1:
-                    for numdos in range( pdos_gaussian.shape[1] ):
-                        output.write( "{:f} {:f}\n".format(
-                            eigen_energy[numdos] + eigen_adjust,
-                            -pdos_gaussian[0, numdos, orbital]
-                            ))
-                else:
-                    for numdos in range( pdos_gaussian.shape[1] ):
-                        output.write( "{:f} {:f}\n".format(
-                            eigen_energy[numdos] + eigen_adjust,
-                            -pdos_gaussian[1, numdos, orbital]
-                            ))
-                output.write( "\n" )
-        else:
-            for orbital in range( pdos_gaussian.shape[2] ):
-                for numdos in range( pdos_gaussian.shape[1] ):
-                    output.write( "{:f} {:f}\n".format(
-                        pdos_gaussian[0, numdos, orbital],
-                        eigen_energy[numdos] + eigen_adjust
-                        ))
-                output.write( "\n" )
-        
-                if pdos_gaussian.shape[0] == 1:
-                    for numdos in range( pdos_gaussian.shape[1] ):
-                        output.write( "{:f} {:f}\n".format(
-                            -pdos_gaussian[0, numdos, orbital],
-                            eigen_energy[numdos] + eigen_adjust
-                            ))
-                else:
-                    for numdos in range( pdos_gaussian.shape[1] ):
-                        output.write( "{:f} {:f}\n".format(
-                            -pdos_gaussian[1, numdos, orbital],
-                            eigen_energy[numdos] + eigen_adjust
-                            ))
-                output.write( "\n" )
+    if not input_files:
+        print( "pickled_extractor.py -i <input> [-i <input> ...] -o <output, - for stdout>" )
+        sys.exit(2)
+    try:
+        ExportPDOS( input_files, output_path, pdos_on_y )
+    except ValueError as error:
+        print( error )
+        sys.exit(2)
 
 if __name__ == "__main__":
     main(sys.argv[1:])
\ No newline at end of file
@@ -4,9 +4,11 @@
 # Post-processing script for VASP output
 #
 # It extracts the pickled .npz in a plain text .dat file with formatted columns
+# Several inputs can be given with repeated -i, each written as <input>.dat
+# (a single -o name is refused), and "-o -" streams to stdout
 
 import sys, getopt
-import numpy as np
+from pdosIO import ExportPDOS
 
 def main( argv ):
     try:
@@ -16,14 +18,14 @@ def main( argv ):
         sys.exit(2)
     
     output_path = None
-    input_file = None
+    input_files = []
     pdos_on_y = True
     for opt, arg in opts:
         if opt == "-h":
-            print( "pickled_extractor.py -i <input> -o <output>" )
+            print( "pickled_extractor.py -i <input> [-i <input> ...] -o <output, - for stdout>" )
             sys.exit()
         elif opt in ( "-i", "--in" ):
-            input_file = arg
+            input_files.append( arg )
         elif opt in ( "-o", "--out" ):
             output_path = arg
         elif opt in ( "-p", "--pdos_on_y" ):
@@ -35,54 +37,14 @@ def main( argv ):
                 print( "-p should be either <True> or <False>" )
                 sys.exit()
 
-    pdos_gaussian = np.load( input_file + ".npz" )['pdos']
-    eigen_energy = np.load( input_file + ".npz" )['eigen_energy']
-    eigen_adjust = np.load( input_file + ".npz" )['eigen_adjust']
-#   eigen_adjust = 2.184686
-
-    with open( output_path+'.dat', 'w' ) as output:
-        if pdos_on_y == True:
-            for numdos in range( pdos_gaussian.shape[1] ):
-                output.write( "{:f} {:f}\n".format(
-                    eigen_energy[numdos] + eigen_adjust,
-                    pdos_gaussian[0, numdos]
-                    ))
-            output.write( "\n" )
-    
-            if pdos_gaussian.shape[0] == 1:
-                for numdos in range( pdos_gaussian.shape[1] ):
-                    output.write( "{:f} {:f}\n".format(
-                        eigen_energy[numdos] + eigen_adjust,
-                        -pdos_gaussian[0, numdos]
-                        ))
-            else:
-                for numdos in range( pdos_gaussian.shape[1] ):
-                    output.write( "{:f} {:f}\n".format(
-                        eigen_energy[numdos] + eigen_adjust,
-                        -pdos_gaussian[1, numdos]
-                        ))
-            output.write( "\n" )
-        else:
-            for numdos in range( pdos_gaussian.shape[1] ):
-                output.write( "{:f} {:f}\n".format(
-                    pdos_gaussian[0, numdos],
-                    eigen_energy[numdos] + eigen_adjust
-                    ))
-            output.write( "\n" )
-    
-            if pdos_gaussian.shape[0] == 1:
-                for numdos in range( pdos_gaussian.shape[1] ):
-                    output.write( "{:f} {:f}\n".format(
-                        -pdos_gaussian[0, numdos],
-                        eigen_energy[numdos] + eigen_adjust
-                        ))
-            else:
-                for numdos in range( pdos_gaussian.shape[1] ):
-                    output.write( "{:f} {:f}\n".format(
-                        -pdos_gaussian[1, numdos],
-                        eigen_energy[numdos] + eigen_adjust
-                        ))
-            output.write( "\n" )
+    if not input_files:
+        print( "pickled_extractor.py -i <input> [-i <input> ...] -o <output, - for stdout>" )
+        sys.exit(2)
+    try:
+        ExportPDOS( input_files, output_path, pdos_on_y )
+    except ValueError as error:
+        print( error )
+        sys.exit(2)
 
 if __name__ == "__main__":
     main(sys.argv[1:])
\ No newline at end of file
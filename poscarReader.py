@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Single pass POSCAR/CONTCAR reader
+
+Reads the comment, scaling factor (a single factor, a negative volume or
+one factor per Cartesian direction), lattice, species and counts (the species
+line is optional, as in VASP 4 files), Selective Dynamics flags and the
+positions, in Direct or Cartesian coordinates. Only the header and the
+position lines are read: the velocity and predictor-corrector blocks of a
+CONTCAR are never touched.
+
+The positions are always returned as fractional coordinates and the lattice
+already scaled, with the lattice vectors as rows, so that frac @ lattice are
+the cartesian positions in Å. Indices and counts follow the file order.
+More at: https://www.vasp.at/wiki/wiki/index.php/POSCAR
+
+Usage: poscarReader.py <POSCAR> ...'''
+
+import sys
+import hashlib
+import numpy as np
+
+FINGERPRINT_DECIMALS = 6
+
+def ScalingFactor ( scale, lattice ):
+    '''Factor of the second line of the POSCAR, applied to the lattice and to
+    Cartesian positions: one universal factor, a negative cell volume or one
+    factor per Cartesian direction'''
+    if len( scale ) == 3:
+        return scale
+    if scale[0] < 0:
+        return np.cbrt( -scale[0]/abs( np.linalg.det( lattice ) ) )
+    return scale[0]
+
+def ReadHeader ( poscar, comment=None ):
+    '''Comment, scaled lattice, scaling factor, species and counts from the
+    lines of an open POSCAR, XDATCAR, ... file (comment, if already read)'''
+    if comment is None:
+        comment = poscar.readline()
+    scale = np.array( poscar.readline().split()[:3], dtype=float )
+    lattice = np.array( [poscar.readline().split()[:3] for i in range( 3 )], dtype=float )
+    factor = ScalingFactor( scale, lattice )
+
+    line = poscar.readline().split()
+    species = None
+    if not line[0].lstrip( '+-' ).isdigit():
+        # VASP 5 species line; the species may end with /POTCAR hashes
+        species = [name.split( '/' )[0].split( '_' )[0] for name in line]
+        line = poscar.readline().split()
+    counts = np.array( line[:len( species ) if species else len( line )], dtype=int )
+    return {
+        'comment': comment.strip(),
+        'lattice': lattice*factor,
+        'factor': factor,
+        'species': species,
+        'counts': counts
+    }
+
+def ParsePositions ( lines, selective ):
+    '''Coordinates and, for Selective Dynamics, the T/F flags of the position
+    lines, ignoring trailing labels'''
+    ncols = 6 if selective else 3
+    tokens = [line.split()[:ncols] for line in lines]
+    if any( len( row ) < ncols for row in tokens ):
+        raise ValueError( "position lines should have {} columns".format( ncols ) )
+    table = np.array( tokens )
+    positions = table[:, :3].astype( float )
+    flags = table[:, 3:] == 'T' if selective else None
+    return positions, flags
+
+def ReadPOSCAR ( poscar_path ):
+    '''Returns a dict with
+        comment, the first line
+        lattice, np.array (3, 3) in Å with the lattice vectors as rows
+        factor, the scaling factor applied to the lattice
+        species, list of element names (None if the file has no species line)
+        counts, np.array with the number of atoms of each species
+        frac, np.array (natoms, 3) with the fractional positions
+        selective, np.array (natoms, 3) of bool with the Selective Dynamics
+        flags, or None
+        cartesian, whether the file had Cartesian positions'''
+    with open( poscar_path ) as poscar:
+        header = ReadHeader( poscar )
+        mode = poscar.readline().strip()
+        selective = mode[:1] in ( 'S', 's' )
+        if selective:
+            mode = poscar.readline().strip()
+        cartesian = mode[:1] in ( 'C', 'c', 'K', 'k' )
+
+        natoms = header['counts'].sum()
+        lines = [poscar.readline() for i in range( natoms )]
+    if not lines or not lines[-1].strip():
+        raise ValueError( "{} has fewer than {} positions".format( poscar_path, natoms ) )
+
+    positions, flags = ParsePositions( lines, selective )
+    if cartesian:
+        positions = np.linalg.solve( header['lattice'].T, (positions*header['factor']).T ).T
+    return dict( header, frac=positions, selective=flags, cartesian=cartesian )
+
+def SpeciesIndices ( poscar, element ):
+    '''0-based indices of the atoms of element'''
+    if poscar['species'] is None:
+        raise ValueError( "the POSCAR has no species line" )
+    labels = np.repeat( poscar['species'], poscar['counts'] )
+    return np.flatnonzero( labels == element )
+
+def StructureFingerprint ( poscar, decimals=FINGERPRINT_DECIMALS ):
+    '''SHA-1 of the lattice, species and positions rounded to decimals, the
+    positions wrapped into the cell and the atoms sorted, so that the same
+    structure written in another atom order or cell image has the same
+    fingerprint (the comment, Selective Dynamics flags and velocities are
+    ignored)'''
+    species = poscar['species'] or [str( count ) for count in range( len( poscar['counts'] ) )]
+    labels = np.repeat( np.arange( len( species ) ), poscar['counts'] )
+    # wrapped after rounding, so that 0.9999999 and 0.0 agree
+    frac = np.round( poscar['frac'], decimals ) % 1.0
+    frac = np.round( frac, decimals ) + 0.0
+    order = np.lexsort( (frac[:, 2], frac[:, 1], frac[:, 0], labels) )
+    digest = hashlib.sha1()
+    digest.update( " ".join( species ).encode() )
+    digest.update( np.asarray( poscar['counts'], dtype=np.int64 ).tobytes() )
+    digest.update( (np.round( poscar['lattice'], decimals ) + 0.0).tobytes() )
+    digest.update( np.ascontiguousarray( frac[order] ).tobytes() )
+    return digest.hexdigest()
+
+def main( argv ):
+    if not argv:
+        print( "poscarReader.py <POSCAR> ..." )
+        sys.exit(2)
+    for poscar_path in argv:
+        poscar = ReadPOSCAR( poscar_path )
+        species = poscar['species'] or ['?']*len( poscar['counts'] )
+        print( "{}: {} ({}), volume {:.3f} Å³{}".format( poscar_path,
+            " ".join( "{}{}".format( name, count ) for name, count in zip( species, poscar['counts'] ) ),
+            poscar['comment'], abs( np.linalg.det( poscar['lattice'] ) ),
+            ", selective dynamics" if poscar['selective'] is not None else "" ) )
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
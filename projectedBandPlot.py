@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Fast projected band structure ("fat band") plots
+
+Draws the output of projectedReader.py, one panel per projection group
+(e.g. "O p", "Nb dyz"), the bands in grey and the weight of the group as
+dots whose area follows the projection. Each panel is two artists whatever
+the number of bands and k-points: one LineCollection holding every band of
+every spin and one scatter holding every dot. The dots are rasterized, so
+the PDF keeps vector axes, bands and text while the point cloud is a
+single image at the dpi given.
+
+Only the bands reaching the energy window are drawn. With decimation
+(default), the dots are binned on a grid of the panel with cells of
+DECIMATION_CELL points (a few pixels, about the size of a small dot) and
+only the heaviest dot of each cell is kept, after dropping those outside
+the energy window or lighter than min_weight of the largest one; the cost
+of drawing then scales with the area of the figure rather than with
+bands x k-points.
+
+The k-path is taken from the k-points and reciprocal basis of the run; with
+a line mode KPOINTS the segments are joined at their ends and labelled.
+
+Usage: projectedBandPlot.py [-i <vasprun.xml>] [-k <KPOINTS>] [-o <output.pdf>] [-s '<selection as JSON>']
+                            [-e <emin:emax>] [-c <columns>] [-r <dpi>] [-a]'''
+
+import sys, getopt
+import json
+import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from projectedReader import CachedProjected
+
+SPIN_COLORS = ('tab:red', 'tab:blue')
+SPIN_LINES = ('solid', 'dashed')
+MARKER_SCALE = 20.0
+MIN_WEIGHT = 1e-3
+DECIMATION_CELL = 1.0
+
+def TickLabel ( label ):
+    '''LaTeX form of a KPOINTS label: \\Gamma, G or GAMMA give $\\Gamma$'''
+    label = label.strip()
+    if label.upper() in ( 'G', 'GAMMA', '\\GAMMA' ):
+        return r'$\Gamma$'
+    if label.startswith( '\\' ):
+        return '$' + label + '$'
+    return label
+
+def ReadLineMode ( kpoints_path ):
+    '''Points per segment and (start, end) labels of each segment of a line
+    mode KPOINTS, or None for any other KPOINTS (or none at all)'''
+    try:
+        with open( kpoints_path ) as kpoints:
+            lines = kpoints.read().splitlines()
+    except OSError:
+        return None
+    if len( lines ) < 4 or not lines[2].strip()[:1] in ( 'l', 'L' ):
+        return None
+    ends = [line.split( '!' )[1] if '!' in line else '' for line in lines[4:] if line.strip()]
+    return int( lines[1].split()[0] ), list( zip( ends[0::2], ends[1::2] ) )
+
+def KPath ( kpoints, rec_basis, kpoints_path='KPOINTS' ):
+    '''Distance along the path of each k-point, with the tick positions and
+    labels of a line mode KPOINTS (empty otherwise)'''
+    steps = np.linalg.norm( np.diff( kpoints @ np.asarray( rec_basis ), axis=0 ), axis=-1 )
+    line_mode = ReadLineMode( kpoints_path )
+    if line_mode is None:
+        return np.concatenate( ([0.0], np.cumsum( steps )) ), [], []
+    points, segments = line_mode
+    segments = segments[:len( kpoints )//points]
+    # no distance between the end of a segment and the start of the next one
+    steps[points - 1::points] = 0.0
+    distances = np.concatenate( ([0.0], np.cumsum( steps )) )
+    ticks = [distances[0]] + [distances[points*k - 1] for k in range( 1, len( segments ) + 1 )]
+    labels = [TickLabel( segments[0][0] )]
+    for k, (start, end) in enumerate( segments ):
+        following = segments[k + 1][0] if k + 1 < len( segments ) else end
+        labels.append( TickLabel( end ) if TickLabel( following ) == TickLabel( end )
+            else TickLabel( end ) + '|' + TickLabel( following ) )
+    return distances, ticks, labels
+
+def Decimate ( x, y, weights, xlim, ylim, cells, min_weight=MIN_WEIGHT ):
+    '''Indices of the dots to draw: inside xlim and ylim, heavier than
+    min_weight*max( weights ) and, among those, the heaviest of each cell of
+    the cells = (columns, rows) grid; cells=None keeps every such dot'''
+    inside = np.flatnonzero( (y >= ylim[0]) & (y <= ylim[1]) & (x >= xlim[0]) & (x <= xlim[1])
+        & (weights > min_weight*weights.max( initial=0.0 )) )
+    if cells is None or not len( inside ):
+        return inside
+    columns, rows = cells
+    cell_x = ((x[inside] - xlim[0])/(xlim[1] - xlim[0])*(columns - 1)).round().astype( np.int64 )
+    cell_y = ((y[inside] - ylim[0])/(ylim[1] - ylim[0])*(rows - 1)).round().astype( np.int64 )
+    order = np.argsort( -weights[inside], kind='stable' )
+    # the first occurrence of each cell in descending weight order is its heaviest dot
+    cell, first = np.unique( (cell_y*columns + cell_x)[order], return_index=True )
+    return inside[order[first]]
+
+def PlotProjectedBands ( data, kpoints_path='KPOINTS', ylim=(-4.0, 4.0), num_column=3, size=None,
+    dpi=300, decimate=True, marker_scale=MARKER_SCALE, min_weight=MIN_WEIGHT, cell=DECIMATION_CELL ):
+    '''Figure of the groups of data (as returned by projectedReader.LoadProjected
+    for a selection), one panel per group, energies relative to the Fermi level'''
+    if not data['groups']:
+        raise ValueError( "the projections were not reduced to groups: extract them with a selection" )
+    groups = data['groups']
+    distances, ticks, labels = KPath( data['kpoints'], data['rec_basis'], kpoints_path )
+    energies = data['eigenvalues'] - data['efermi']
+    # bands reaching the window only; noncollinear runs: only the total
+    # (first) projection has eigenvalues to go with
+    shown = np.flatnonzero( (energies.max( axis=(0, 1) ) >= ylim[0]) & (energies.min( axis=(0, 1) ) <= ylim[1]) )
+    energies = energies[..., shown]
+    projections = data['projections'][:len( energies ), :, shown]
+    spins, nkpoints, nbands = energies.shape
+    xlim = (distances[0], distances[-1])
+
+    rows = -(-len( groups )//num_column)
+    columns = min( num_column, len( groups ) )
+    FIG = Figure( figsize=size or (3.5*columns, 3.0*rows), dpi=dpi )
+    AXES = FIG.subplots( rows, columns, sharex=True, sharey=True, squeeze=False ).ravel()
+
+    # (spin*band, kpoint, 2) polylines, shared by every panel
+    segments = np.stack( np.broadcast_arrays( distances[np.newaxis, np.newaxis, :], energies.transpose( 0, 2, 1 ) ), axis=-1 )
+    segments = segments.reshape( spins*nbands, nkpoints, 2 )
+    band_styles = np.repeat( SPIN_LINES[:spins], nbands ).tolist()
+    # flat dots: x and energy of every (spin, kpoint, band)
+    x = np.broadcast_to( distances[np.newaxis, :, np.newaxis], energies.shape ).ravel()
+    y = energies.ravel()
+    spin_of = np.repeat( np.arange( spins ), nkpoints*nbands )
+    scale = marker_scale/max( float( np.max( projections, initial=0.0 ) ), 1e-12 )
+
+    for group, AX in enumerate( AXES[:len( groups )] ):
+        AX.add_collection( LineCollection( segments, colors='0.6', linewidths=0.5, linestyles=band_styles, zorder=1 ) )
+        weights = np.asarray( projections[..., group], dtype=float ).ravel()
+        if decimate:
+            box = AX.get_position()
+            # 72 points per inch
+            cells = (max( int( box.width*FIG.get_figwidth()*72/cell ), 2 ), max( int( box.height*FIG.get_figheight()*72/cell ), 2 ))
+        else:
+            cells = None
+        keep = Decimate( x, y, weights, xlim, ylim, cells, min_weight )
+        AX.scatter( x[keep], y[keep], s=weights[keep]*scale, c=np.asarray( SPIN_COLORS )[spin_of[keep]],
+            edgecolors='none', rasterized=True, zorder=2 )
+        AX.axhline( 0.0, color='black', linewidth=0.5, linestyle='dotted' )
+        for tick in ticks:
+            AX.axvline( tick, color='black', linewidth=0.5 )
+        AX.set_title( groups[group] )
+    for AX in AXES[len( groups ):]:
+        AX.set_visible( False )
+
+    AXES[0].set_xlim( xlim )
+    AXES[0].set_ylim( ylim )
+    AXES[0].set_xticks( ticks )
+    AXES[0].set_xticklabels( labels )
+    for AX in AXES[::columns]:
+        AX.set_ylabel( r'$E - E_f$ (eV)' )
+    FIG.tight_layout()
+    return FIG
+
+def main( argv ):
+    usage = "projectedBandPlot.py -i <vasprun.xml> -k <KPOINTS> -o <output.pdf> -s '<selection as JSON>' -e <emin:emax> -c <columns> -r <dpi> -a"
+    try:
+        opts, args = getopt.getopt( argv, "hi:k:o:s:e:c:r:a", ["in=", "kpoints=", "out=", "selection=", "energy=", "columns=", "dpi=", "all"] )
+    except getopt.GetoptError:
+        print( usage )
+        sys.exit(2)
+
+    vasprun_path = 'vasprun.xml'
+    kpoints_path = 'KPOINTS'
+    output_path = 'bandstructure.pdf'
+    selection = {'O': ['p'], 'Nb': ['dyz', 'dx2', 'dz2']}
+    ylim = (-4.0, 4.0)
+    num_column = 3
+    dpi = 300
+    decimate = True
+    for opt, arg in opts:
+        if opt == "-h":
+            print( usage )
+            sys.exit()
+        elif opt in ( "-i", "--in" ):
+            vasprun_path = arg
+        elif opt in ( "-k", "--kpoints" ):
+            kpoints_path = arg
+        elif opt in ( "-o", "--out" ):
+            output_path = arg
+        elif opt in ( "-s", "--selection" ):
+            selection = json.loads( arg )
+        elif opt in ( "-e", "--energy" ):
+            ylim = tuple( float( value ) for value in arg.split( ':' ) )
+        elif opt in ( "-c", "--columns" ):
+            num_column = int( arg )
+        elif opt in ( "-r", "--dpi" ):
+            dpi = int( arg )
+        elif opt in ( "-a", "--all" ):
+            decimate = False
+
+    # extracted once next to vasprun.xml, reused while the run is unchanged
+    data = CachedProjected( vasprun_path, vasprun_path[:-len( '.xml' )] if vasprun_path.endswith( '.xml' ) else vasprun_path, selection )
+    FIG = PlotProjectedBands( data, kpoints_path, ylim, num_column, dpi=dpi, decimate=decimate )
+    FIG.savefig( output_path, dpi=dpi )
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Streaming extraction of the projected eigenvalues of vasprun.xml
+
+The <projected> block, (spin, kpoint, band, ion, orbital), is the largest
+part of a band structure run. It is read here in one forward pass (see
+vasprunReader.py), one k-point at a time, and written straight into a
+disk-backed float32 array, so the memory used is that of a single k-point
+whatever the size of the run. With a selection such as
+    {'O': ['p'], 'Nb': ['dyz', 'dx2', 'dz2']}
+the ions of each element and the orbitals of each entry ('p' sums py, pz
+and px, see pdosSelection.OrbitalWeights) are summed on the fly, leaving
+one column per (element, orbital) entry.
+
+The output <name>.proj directory holds projections.npy, (spin, kpoint,
+band, ion, orbital) or (spin, kpoint, band, group), eigenvalues.npy,
+(spin, kpoint, band), kpoints.npy (fractional coordinates) and meta.json
+(ISPIN, Fermi level, reciprocal basis, elements, fields, group names and
+the record of vasprun.xml, so that CachedProjected only extracts again
+when the run or the selection changed).
+
+This is the only store of the projections: bandstructureCache.py keeps the
+pymatgen BandStructure without them for pymatgen_bandstructure_info.py and
+pymatgen_1bz.py, so a run used by both kinds of script is parsed once into
+each store.
+
+Usage: projectedReader.py [-i <vasprun.xml>] [-o <output>] [-s '<selection as JSON>']'''
+
+import sys, getopt
+import json
+import os
+import xml.etree.ElementTree as et
+import numpy as np
+from fileCache import FileRecord, IsFresh, ReadJSON, WriteJSON
+from instrumentation import Progress, Stage
+from pdosSelection import OrbitalWeights
+from vasprunReader import ParseRows
+
+def ProjectionWeights ( selection, elements, fields ):
+    '''Group names and the (ion*orbital, group) weights summing, for each
+    element and orbital of selection, every ion of that element'''
+    elements = np.asarray( elements )
+    groups, columns = [], []
+    for element, orbitals in selection.items():
+        ions = (elements == element).astype( float )
+        if not ions.any():
+            raise ValueError( "no {} ions in {}".format( element, sorted( set( elements ) ) ) )
+        for orbital in orbitals:
+            # OrbitalWeights expects the <partial> layout, energy column first
+            weights = OrbitalWeights( [orbital], ['energy'] + list( fields ) )
+            columns.append( np.outer( ions, weights ).ravel() )
+            groups.append( "{} {}".format( element, orbital ) )
+    return groups, np.stack( columns, axis=-1 )
+
+def ReadProjected ( vasprun_path, output_path, selection=None, verbose=True ):
+    '''Extracts the eigenvalues and the projections of vasprun_path into
+    <output_path>.proj, reduced by selection if given, and returns it as LoadProjected does'''
+    ispin = nbands = efermi = noncollinear = rec_basis = None
+    record = FileRecord( vasprun_path )
+    elements, fields, kpoint_rows, basis_rows = [], [], [], []
+    groups = weights = None
+    directory = output_path + '.proj'
+    os.makedirs( directory, exist_ok=True )
+    temporary = os.path.join( directory, 'projections.tmp.npy' )
+
+    path = []
+    projected = eigen = -1
+    eigen_done = in_kpointlist = in_atoms = in_basis = False
+    column = spin = kpoint = -1
+    rows = []
+    with Stage( 'xml_read' ) as stage:
+        for event, elem in et.iterparse( vasprun_path, events=('start', 'end') ):
+            if event == 'start':
+                path.append( elem.tag )
+                if elem.tag == 'projected':
+                    projected = len( path ) - 1
+                elif elem.tag == 'eigenvalues' and projected < 0 and not eigen_done:
+                    eigen = len( path ) - 1
+                elif elem.tag == 'varray' and elem.get( 'name' ) == 'kpointlist' and not kpoint_rows:
+                    in_kpointlist = True
+                elif elem.tag == 'varray' and elem.get( 'name' ) == 'rec_basis' and rec_basis is None:
+                    in_basis = True
+                elif elem.tag == 'array' and elem.get( 'name' ) == 'atoms':
+                    in_atoms = True
+                elif elem.tag == 'rc':
+                    column = 0
+                elif elem.tag == 'set' and projected >= 0 and path[projected + 1] == 'array':
+                    depth = len( path ) - 1 - projected
+                    if depth == 2:
+                        # projected/array/set: the <field> headers were already read
+                        spins = 4 if noncollinear else ispin
+                        shape = (spins, len( kpoints ), nbands)
+                        if selection:
+                            groups, weights = ProjectionWeights( selection, elements, fields )
+                            shape += (len( groups ),)
+                        else:
+                            shape += (len( elements ), len( fields ))
+                        projections = np.lib.format.open_memmap( temporary, mode='w+', dtype=np.float32, shape=shape )
+                        progress = Progress( "extracting k-points", spins*len( kpoints ), verbose )
+                    elif depth == 3:
+                        spin += 1
+                        kpoint = -1
+                    elif depth == 4:
+                        kpoint += 1
+                elif elem.tag == 'set' and eigen >= 0:
+                    depth = len( path ) - 1 - eigen
+                    if depth == 2:
+                        eigenvalues = np.empty( (1 if noncollinear else ispin, len( kpoints ), nbands) )
+                    elif depth == 3:
+                        spin += 1
+                        kpoint = -1
+                    elif depth == 4:
+                        kpoint += 1
+                continue
+
+            path.pop()
+            tag = elem.tag
+            if tag == 'i':
+                name = elem.get( 'name' )
+                if name == 'ISPIN' and ispin is None:
+                    ispin = int( elem.text )
+                elif name == 'NBANDS' and nbands is None:
+                    nbands = int( elem.text )
+                elif name == 'efermi' and efermi is None:
+                    efermi = float( elem.text )
+                elif name == 'LNONCOLLINEAR' and noncollinear is None:
+                    noncollinear = elem.text.strip() == 'T'
+            elif in_kpointlist:
+                if tag == 'v':
+                    kpoint_rows.append( elem.text )
+                elif tag == 'varray':
+                    in_kpointlist = False
+                    kpoints = ParseRows( kpoint_rows, 3 )
+            elif in_basis:
+                if tag == 'v':
+                    basis_rows.append( elem.text )
+                elif tag == 'varray':
+                    in_basis = False
+                    rec_basis = ParseRows( basis_rows, 3 )
+            elif in_atoms:
+                if tag == 'c':
+                    # <rc><c>element</c><c>type</c></rc>
+                    if column == 0:
+                        elements.append( elem.text.strip() )
+                    column += 1
+                elif tag == 'array':
+                    in_atoms = False
+            elif eigen >= 0:
+                if tag == 'r':
+                    rows.append( elem.text )
+                elif tag == 'set' and len( path ) - eigen == 4:
+                    # End of a k-point <set>: energy and occupation of each band
+                    eigenvalues[spin, kpoint] = ParseRows( rows, 2 )[:, 0]
+                    rows = []
+                elif tag == 'eigenvalues':
+                    eigen = spin = -1
+                    eigen_done = True
+            elif projected >= 0 and path[projected + 1:projected + 2] == ['array']:
+                if tag == 'r':
+                    rows.append( elem.text )
+                elif tag == 'field':
+                    fields.append( elem.text.strip() )
+                elif tag == 'set' and len( path ) - projected == 4:
+                    # End of a k-point <set>: every band of every ion at once
+                    block = ParseRows( rows, len( fields ) ).reshape( nbands, len( elements ), len( fields ) )
+                    if weights is None:
+                        projections[spin, kpoint] = block
+                    else:
+                        projections[spin, kpoint] = block.reshape( nbands, -1 ) @ weights
+                    rows = []
+                    progress.update()
+                    stage.items += nbands
+            elif tag == 'projected':
+                break
+            elem.clear()
+
+    if projected < 0:
+        raise ValueError( "{} has no <projected> block (LORBIT was not set)".format( vasprun_path ) )
+    projections.flush()
+    del projections
+    os.replace( temporary, os.path.join( directory, 'projections.npy' ) )
+    np.save( os.path.join( directory, 'eigenvalues.npy' ), eigenvalues )
+    np.save( os.path.join( directory, 'kpoints.npy' ), kpoints )
+    WriteJSON( os.path.join( directory, 'meta.json' ), {
+        'vasprun': record,
+        'ispin': ispin,
+        'efermi': efermi,
+        'noncollinear': noncollinear,
+        'rec_basis': rec_basis.tolist(),
+        'elements': elements,
+        'fields': fields,
+        'groups': groups,
+        'selection': selection
+    } )
+    return LoadProjected( output_path )
+
+def CachedProjected ( vasprun_path, output_path, selection=None, verbose=True ):
+    '''LoadProjected( output_path ), extracting it first if missing, stale or
+    written with another selection'''
+    meta = ReadJSON( os.path.join( output_path + '.proj', 'meta.json' ) )
+    if meta is None or meta.get( 'selection' ) != selection or not IsFresh( vasprun_path, meta.get( 'vasprun' ) ):
+        return ReadProjected( vasprun_path, output_path, selection, verbose )
+    return LoadProjected( output_path )
+
+def LoadProjected ( input_path, mmap=True ):
+    '''Reads <input_path>.proj; projections is memory-mapped unless mmap is False'''
+    directory = input_path + '.proj'
+    data = ReadJSON( os.path.join( directory, 'meta.json' ) )
+    if data is None:
+        raise FileNotFoundError( "{} has no meta.json".format( directory ) )
+    data['projections'] = np.load( os.path.join( directory, 'projections.npy' ), mmap_mode='r' if mmap else None )
+    data['eigenvalues'] = np.load( os.path.join( directory, 'eigenvalues.npy' ) )
+    data['kpoints'] = np.load( os.path.join( directory, 'kpoints.npy' ) )
+    return data
+
+def main( argv ):
+    usage = "projectedReader.py -i <vasprun.xml> -o <output> -s '<selection as JSON>'"
+    try:
+        opts, args = getopt.getopt( argv, "hi:o:s:", ["in=", "out=", "selection="] )
+    except getopt.GetoptError:
+        print( usage )
+        sys.exit(2)
+
+    vasprun_path = 'vasprun.xml'
+    output_path = 'projected'
+    selection = None
+    for opt, arg in opts:
+        if opt == "-h":
+            print( usage )
+            sys.exit()
+        elif opt in ( "-i", "--in" ):
+            vasprun_path = arg
+        elif opt in ( "-o", "--out" ):
+            output_path = arg
+        elif opt in ( "-s", "--selection" ):
+            selection = json.loads( arg )
+
+    data = ReadProjected( vasprun_path, output_path, selection )
+    print( "projections {} written on {}.proj".format( data['projections'].shape, output_path ) )
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
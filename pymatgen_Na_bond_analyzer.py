@@ -1,83 +1,139 @@
 #!/usr/bin/env python3
+'''Na-O bond lengths of each Na layer along the strain series
+
+Each strain directory is analysed on a pool of processes. The BVAnalyzer
+oxidation states are computed once per composition (species and counts in
+site order, identical along a strain series) and stored in
+CACHE_DIR/oxidation.json. The Na-O distances of each CONTCAR are stored in
+CACHE_DIR/<CONTCAR sha1>.json, so re-plotting or adding a strain point only
+analyses the structures that are new or changed. The bonds and their
+per atom, layer and strain statistics are saved in NaObonds.npz (bondStats).'''
+
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pymatgen import Structure
 from pymatgen.analysis.bond_valence import BVAnalyzer
 from pymatgen.analysis.local_env import CrystalNN
 import matplotlib.pyplot as plt
 import numpy as np
+from bondStats import BondStats, RaggedBonds, SaveBondStats
+from fileCache import FileDigest, ReadJSON, WriteJSON
+from poscarReader import ReadPOSCAR
+from slabLayers import SlabLayers, SymmetricShells
 
 sites_Na = [[55, 59, 64, 68], [51, 54, 60, 63], [56, 58, 65, 67], [52, 53, 62, 64], [57, 57, 67, 67]]
 directories = ["c5", "c4", "c3", "c2", "c1", "relax", "t1", "t2", "t3", "t4", "t5"]
 o_fig = o_file = 'NaObonds'
-all_dist_NaO = []# (strain,layers,atom,bond)
+# Number of worker processes (None for one per CPU)
+processes = None
+CACHE_DIR = '.bond_cache'
+# CONTCAR whose Na layers replace the table above, e.g. "relax/CONTCAR" (None keeps the table)
+auto_sites = None
 
-for element in directories:
-"""
-This populates the distances array with all the Na-O bonds detected by the CrystalNN routine.
-The innermost index varies in size as each atom in sites_Na can have more or less neigbours.
-The second innermost index size is always 4 due to array symmetry reasons. It registers the number of Na atoms at a layer
-The third innermost index is 5. It is the number of layers in the slab.
-The first index registers the strain steps taken.
-"""
-    input_struct = Structure.from_file( element+"/CONTCAR" )
-    ox_struct = BVAnalyzer().get_oxi_state_decorated_structure( input_struct )
-    dist_NaO = []
-    for layer, atom_list in enumerate( sites_Na ):
-        layer_atoms = []
-        for atom in atom_list:
-            atom_neigbors = CrystalNN( cation_anion=True ).get_nn( ox_struct, atom-1 )
-            distances = []
-            for neighbor in range( len( atom_neigbors ) ):
-                distances.append( atom_neigbors[neighbor].distance( input_struct[atom-1] ) )
-            layer_atoms.append( distances )
-        dist_NaO.append( layer_atoms )
-    all_dist_NaO.append( dist_NaO )
+def CompositionKey ( contcar_path ):
+    '''Species and counts in site order, e.g. "Na18 Nb16 O52"'''
+    contcar = ReadPOSCAR( contcar_path )
+    return " ".join( "{}{}".format( name, count ) for name, count in zip( contcar['species'], contcar['counts'] ) )
 
-avrg_bond = np.zeros( [len(all_dist_NaO), len(all_dist_NaO[0]), len(all_dist_NaO[0][0])] )
-avrg_layer = np.zeros( [len(all_dist_NaO), len(all_dist_NaO[0])] )
-stdev_bond = np.zeros( [len(all_dist_NaO), len(all_dist_NaO[0]), len(all_dist_NaO[0][0])] )
-stdev_layer = np.zeros( [len(all_dist_NaO), len(all_dist_NaO[0])] )
+def OxidationStates ( contcar_paths ):
+    '''BVAnalyzer valences of each site, computed once per composition and kept on disk'''
+    cache_path = os.path.join( CACHE_DIR, 'oxidation.json' )
+    valences = ReadJSON( cache_path ) or {}
+    keys = {path: CompositionKey( path ) for path in contcar_paths}
+    for path, key in keys.items():
+        if key not in valences:
+            valences[key] = [int( valence ) for valence in BVAnalyzer().get_valences( Structure.from_file( path ) )]
+            WriteJSON( cache_path, valences )
+    return {path: valences[key] for path, key in keys.items()}
 
-iterator = np.nditer( avrg_bond, flags=['multi_index'] )
+def NeighbourDistances ( structure, sites ):
+    '''Distances from each of sites (0-based) to its CrystalNN neighbours, with
+    one CrystalNN for the structure and each distinct site resolved once.
+    Returns the flat distances and the number of neighbours of each site.
 
-for bond in iterator:
-"""
-Average bond length and standard deviation of each bond around each Na atom.
-Here st dev is taken to measure how the polyhedra is deformed. A st dev close to 0 points to a regular polyhedra.
-"""
-    avrg_bond[iterator.multi_index[0]][iterator.multi_index[1]][iterator.multi_index[2]] = np.average( all_dist_NaO[iterator.multi_index[0]][iterator.multi_index[1]][iterator.multi_index[2]] )
-    stdev_bond[iterator.multi_index[0]][iterator.multi_index[1]][iterator.multi_index[2]] = np.std( all_dist_NaO[iterator.multi_index[0]][iterator.multi_index[1]][iterator.multi_index[2]] )
+    The neighbour search itself still runs once per site inside get_nn_info:
+    CrystalNN weighs the candidates by solid angle and cannot take a shared
+    structure.get_neighbor_list, which would give a plain cutoff shell
+    instead of the CrystalNN polyhedra.'''
+    unique_sites, inverse = np.unique( sites, return_inverse=True )
+    crystal_nn = CrystalNN( cation_anion=True )
+    nn_info = [crystal_nn.get_nn_info( structure, int( site ) ) for site in unique_sites]
+    counts = np.array( [len( info ) for info in nn_info], dtype=int )
+    neighbours = np.array( [neighbor['site_index'] for info in nn_info for neighbor in info], dtype=int )
+    images = np.array( [neighbor['image'] for info in nn_info for neighbor in info], dtype=float ).reshape( -1, 3 )
+    frac = structure.frac_coords
+    # Neighbours are periodic images: the bond vector is not the minimum image one
+    vectors = (frac[neighbours] + images - frac[np.repeat( unique_sites, counts )]) @ structure.lattice.matrix
+    distances = np.linalg.norm( vectors, axis=-1 )
 
-iterator = np.nditer( avrg_bond, flags=['multi_index'] )
+    # Back to the requested order, repeated sites included
+    starts = np.cumsum( counts ) - counts
+    size = counts[inverse]
+    within = np.arange( size.sum() ) - np.repeat( np.cumsum( size ) - size, size )
+    return distances[np.repeat( starts[inverse], size ) + within], size
+
+def AnalyzeDirectory ( element, sites_Na, valences ):
+    '''Pool task: Na-O distances of one strain directory, flat over the atoms
+    of sites_Na, with the number of bonds of each atom'''
+    input_struct = Structure.from_file( element+"/CONTCAR" )
+    input_struct.add_oxidation_state_by_site( valences )
+    distances, bonds = NeighbourDistances( input_struct, np.concatenate( sites_Na ) - 1 )
+    return {'distances': distances, 'bonds': bonds}
 
-for atoms in iterator:
-"""
-Same logic of last loop but taking the average and st dev of the 4 atoms in each layer.
-"""
-    avrg_layer[iterator.multi_index[0]][iterator.multi_index[1]] = np.average( avrg_bond[iterator.multi_index[0]][iterator.multi_index[1]] )
-    stdev_layer[iterator.multi_index[0]][iterator.multi_index[1]] = np.std( stdev_bond[iterator.multi_index[0]][iterator.multi_index[1]] )
+def BondDistances ( directories, sites_Na ):
+    """
+    Na-O bonds detected by the CrystalNN routine, one AnalyzeDirectory result per strain step.
+    Each atom in sites_Na can have more or less neigbours, and the middle layer has fewer atoms.
+    """
+    os.makedirs( CACHE_DIR, exist_ok=True )
+    cache_paths = {element: os.path.join( CACHE_DIR, FileDigest( element+"/CONTCAR" ) + '.json' ) for element in directories}
+    all_dist_NaO = {}
+    for element in directories:
+        cached = ReadJSON( cache_paths[element] )
+        if cached is not None and cached.get( 'sites_Na' ) == sites_Na and 'distances' in cached:
+            all_dist_NaO[element] = {'distances': np.array( cached['distances'] ), 'bonds': np.array( cached['bonds'], dtype=int )}
 
-iterator = np.nditer( avrg_layer, flags=['multi_index'] )
-xaxis = np.array( range( -5,6 ) )
+    missing = [element for element in directories if element not in all_dist_NaO]
+    if missing:
+        valences = OxidationStates( [element+"/CONTCAR" for element in missing] )
+        with ProcessPoolExecutor( max_workers=processes ) as pool:
+            futures = {element: pool.submit( AnalyzeDirectory, element, sites_Na, valences[element+"/CONTCAR"] ) for element in missing}
+            for element, future in futures.items():
+                all_dist_NaO[element] = future.result()
+                WriteJSON( cache_paths[element], {'sites_Na': sites_Na,
+                    'distances': all_dist_NaO[element]['distances'].tolist(), 'bonds': all_dist_NaO[element]['bonds'].tolist()} )
+                print( "{}: analysed".format( element ) )
+    return [all_dist_NaO[element] for element in directories]
 
-for layers in iterator:
-"""
-Creates a plt object with the NaO bond distance in y, strain in x and st dev as symmetric error lines
-"""
-    plt.errorbar( xaxis,
-                  avrg_layer[..., iterator.multi_index[1]],
-                  yerr=stdev_layer[..., iterator.multi_index[1]],
-                  label='layer '+str( iterator.multi_index[1]+1 ),
-                  marker='o',
-                  linestyle='dashed',
-                  elinewidth=1,
-                  capsize=2,
-                  capthick=1 )
+if __name__ == "__main__":
+    if auto_sites:
+        # Each group is a pair of layers symmetric around the middle, the middle layer alone at the end
+        sites_Na = [(shell + 1).tolist() for shell in SymmetricShells( SlabLayers( auto_sites, 'Na' )[0] )]
+    results = BondDistances( directories, sites_Na )
+    bonds = RaggedBonds( results, sites_Na )
+    stats = BondStats( bonds )
+    SaveBondStats( o_file, bonds, stats )
+    # Average over the atoms of each layer of the mean Na-O bond, and st dev of the polyhedra st devs
+    avrg_layer = stats['layer_atom_mean']
+    stdev_layer = stats['layer_atom_std']
+    xaxis = np.array( range( -5,6 ) )
 
-plt.xlabel( 'Strain (%)' )
-plt.xticks( xaxis )
-plt.ylabel( 'Na-O bond length (Å)' )
-plt.legend()
-plt.savefig( o_fig+'.pdf', dpi=300, orientation='portrait', papertype='a4', format='pdf', transparent=True )
+    for layer in range( avrg_layer.shape[1] ):
+        # Creates a plt object with the NaO bond distance in y, strain in x and st dev as symmetric error lines
+        plt.errorbar( xaxis,
+                      avrg_layer[..., layer],
+                      yerr=stdev_layer[..., layer],
+                      label='layer '+str( layer+1 ),
+                      marker='o',
+                      linestyle='dashed',
+                      elinewidth=1,
+                      capsize=2,
+                      capthick=1 )
 
-np.savetxt( o_file+'.csv', np.hstack( (avrg_layer, stdev_layer) ), fmt='%-3.4f' )# (strain, layer(0 to 4) and stdev(5 to 9))
+    plt.xlabel( 'Strain (%)' )
+    plt.xticks( xaxis )
+    plt.ylabel( 'Na-O bond length (Å)' )
+    plt.legend()
+    plt.savefig( o_fig+'.pdf', dpi=300, orientation='portrait', papertype='a4', format='pdf', transparent=True )
 
+    np.savetxt( o_file+'.csv', np.hstack( (avrg_layer, stdev_layer) ), fmt='%-3.4f' )# (strain, layers and then their stdev)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
-from pymatgen.io.vasp.outputs import BSVasprun
+from bandstructureCache import LoadBandStructure
 
-raw = BSVasprun("vasprun.xml")
-bandstructure = raw.get_band_structure("KPOINTS")
-bandstructure.get_band_gap()
+bandstructure = LoadBandStructure("vasprun.xml", "KPOINTS")
+gap = bandstructure.get_band_gap()
+print("band gap: {:.4f} eV ({}, {})".format(gap['energy'], 'direct' if gap['direct'] else 'indirect', gap['transition']))
+print("Fermi level: {:.4f} eV".format(bandstructure.efermi))
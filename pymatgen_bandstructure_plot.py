@@ -1,20 +1,18 @@
 #!/bin/env python3
 """Alexandre Olivieri (olivieri.alexandre0@gmail.com)
 
-Simple plot generation from the vasprun.xml and KPOINTS files."""
+Simple plot generation from the vasprun.xml and KPOINTS files.
 
-from pymatgen.io.vasp import BSVasprun
-from pymatgen.electronic_structure.plotter import BSPlotterProjected
-from matplotlib import pyplot as plt
+The O p and Nb dyz, dx2 and dz2 projections, summed over the atoms of each
+element, are streamed from vasprun.xml once (projectedReader.py, kept in
+vasprun.proj while the run is unchanged) and drawn by projectedBandPlot.py,
+one LineCollection and one rasterized scatter per panel. The bands cache of
+bandstructureCache.py, used by the other pymatgen scripts, holds no
+projections."""
 
-VRUN = BSVasprun('vasprun.xml', parse_projected_eigen=True)
-BS = VRUN.get_band_structure(kpoints_filename='KPOINTS', line_mode=True)
-BANDPLOTTER = BSPlotterProjected(BS)
-plot = BANDPLOTTER.get_projected_plots_dots_patom_pmorb(
-        {'O':['p'], 'Nb':['dyz', 'dx2', 'dz2']},
-        {'O':['all'], 'Nb':['all']},
-        sum_atoms={'O':['all'], 'Nb':['all']},
-        sum_morbs={'O':['p']},
-        num_column=3
-)
-plot.savefig('bandstructure.pdf', dpi=1000)
+from projectedBandPlot import PlotProjectedBands
+from projectedReader import CachedProjected
+
+DATA = CachedProjected('vasprun.xml', 'vasprun', {'O':['p'], 'Nb':['dyz', 'dx2', 'dz2']})
+plot = PlotProjectedBands(DATA, 'KPOINTS', num_column=3, dpi=300)
+plot.savefig('bandstructure.pdf', dpi=300)
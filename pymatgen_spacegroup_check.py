@@ -1,7 +1,140 @@
 #!/usr/bin/env python3
+'''Space groups of many structures over a symprec sweep
+
+Each structure (a POSCAR/CONTCAR, or the CONTCAR of a directory) is
+analysed by SpacegroupAnalyzer at every symprec of the sweep, on a pool of
+processes. The results are cached in CACHE_PATH by structure fingerprint
+(poscarReader.StructureFingerprint: lattice, species and rounded positions,
+read without pymatgen) and tolerances (symprec and angle tolerance), so an
+unchanged structure, even copied or renamed, is never analysed again for
+tolerances already done.
+
+The space group of every structure at every symprec is printed as one
+table, the structures whose space group changes along the sweep marked
+with *, and written as CSV with -o.
+
+Usage: pymatgen_spacegroup_check.py [-s <symprec,symprec,...>] [-a <angle tolerance>] [-n <processes>] [-o <table.csv>] [<POSCAR | dir> ...]'''
+
+import sys, getopt
+import csv
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pymatgen import Structure
 from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
+from fileCache import ReadJSON, WriteJSON
+from poscarReader import ReadPOSCAR, StructureFingerprint
+
+SYMPRECS = (1e-5, 1e-3, 1e-2, 1e-1)
+ANGLE_TOLERANCE = 5.0
+CACHE_PATH = '.symmetry_cache.json'
+
+def SymprecKey(symprec):
+    return "{:g}".format(symprec)
+
+def ToleranceKey(symprec, angle_tolerance=ANGLE_TOLERANCE):
+    '''Cache key of one analysis of a structure'''
+    return "symprec {:g} angle {:g}".format(symprec, angle_tolerance)
+
+def AnalyzeStructure(path, symprecs, angle_tolerance=ANGLE_TOLERANCE):
+    '''Pool task: never raises, the error is returned in the report'''
+    report = {'path': path, 'groups': {}, 'error': None}
+    try:
+        structure = Structure.from_file(path)
+        for symprec in symprecs:
+            analyzer = SpacegroupAnalyzer(structure, symprec=symprec, angle_tolerance=angle_tolerance)
+            report['groups'][ToleranceKey(symprec, angle_tolerance)] = "{} ({})".format(
+                analyzer.get_space_group_symbol(), analyzer.get_space_group_number())
+    except Exception:
+        report['error'] = traceback.format_exc()
+    return report
+
+def StructurePath(path):
+    return os.path.join(path, 'CONTCAR') if os.path.isdir(path) else path
+
+def SpaceGroups(paths, symprecs=SYMPRECS, processes=None, angle_tolerance=ANGLE_TOLERANCE):
+    '''Space group of each structure at each symprec, {path: {symprec key:
+    "symbol (number)"}}, analysing only what the cache does not hold'''
+    cache = ReadJSON(CACHE_PATH) or {}
+    fingerprints = {}
+    for path in paths:
+        try:
+            fingerprints[path] = StructureFingerprint(ReadPOSCAR(path))
+        except (OSError, ValueError) as error:
+            print("{}: unreadable ({})".format(path, error), file=sys.stderr)
+            fingerprints[path] = None
+    # one task per distinct structure, with the symprecs it still lacks
+    pending = {}
+    for path, fingerprint in fingerprints.items():
+        if fingerprint is None:
+            continue
+        missing = [symprec for symprec in symprecs
+            if ToleranceKey(symprec, angle_tolerance) not in cache.get(fingerprint, {})]
+        if missing and fingerprint not in pending:
+            pending[fingerprint] = (path, missing)
+    print("{} structures ({} distinct), {} to analyse".format(
+        len(paths), len(set(fingerprints.values()) - {None}), len(pending)))
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = {pool.submit(AnalyzeStructure, path, missing, angle_tolerance): fingerprint
+                for fingerprint, (path, missing) in pending.items()}
+            for done, future in enumerate(as_completed(futures), start=1):
+                report = future.result()
+                print("[{}/{}] {}: {}".format(done, len(pending), report['path'], "failed" if report['error'] else "done"))
+                if report['error']:
+                    print(report['error'], file=sys.stderr)
+                    continue
+                cache.setdefault(futures[future], {}).update(report['groups'])
+        WriteJSON(CACHE_PATH, cache)
+    groups = {}
+    for path, fingerprint in fingerprints.items():
+        known = cache.get(fingerprint, {}) if fingerprint else {}
+        groups[path] = {SymprecKey(symprec): known.get(ToleranceKey(symprec, angle_tolerance),
+            'failed' if fingerprint else 'unreadable')
+            for symprec in symprecs}
+    return groups
+
+def main(argv):
+    usage = "pymatgen_spacegroup_check.py -s <symprec,symprec,...> -a <angle tolerance> -n <processes> -o <table.csv> [<POSCAR | dir> ...]"
+    try:
+        opts, args = getopt.getopt(argv, "hs:a:n:o:", ["symprec=", "angle=", "processes=", "out="])
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+
+    symprecs = SYMPRECS
+    angle_tolerance = ANGLE_TOLERANCE
+    processes = None
+    output_path = None
+    for opt, arg in opts:
+        if opt == "-h":
+            print(usage)
+            sys.exit()
+        elif opt in ("-s", "--symprec"):
+            symprecs = [float(value) for value in arg.split(',')]
+        elif opt in ("-a", "--angle"):
+            angle_tolerance = float(arg)
+        elif opt in ("-n", "--processes"):
+            processes = int(arg)
+        elif opt in ("-o", "--out"):
+            output_path = arg
+
+    paths = [StructurePath(path) for path in (args or ["POSCAR"])]
+    groups = SpaceGroups(paths, symprecs, processes, angle_tolerance)
+
+    keys = [SymprecKey(symprec) for symprec in symprecs]
+    rows = [[path] + [groups[path][key] for key in keys] + ['*' if len(set(groups[path].values())) > 1 else '']
+        for path in paths]
+    header = ['structure'] + ['symprec ' + key for key in keys] + ['changes']
+    widths = [max(len(str(row[column])) for row in [header] + rows) for column in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)).rstrip())
+    if output_path:
+        with open(output_path, 'w', newline='') as output:
+            writer = csv.writer(output)
+            writer.writerow(header)
+            writer.writerows(rows)
 
-structure = Structure.from_file("POSCAR")
-analyze = SpacegroupAnalyzer(structure)
-analyze.get_space_group_symbol()
\ No newline at end of file
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Layer detection and site tables of a slab
+
+The atoms of one species are sorted by their height along the surface
+normal (the lattice vector given by axis, the other two spanning the
+surface) and split into layers wherever two consecutive heights are more
+than tolerance Å apart. Heights are measured from the middle of the vacuum,
+so a slab crossing the cell boundary is kept whole. The layers are returned
+bottom to top as arrays of 0-based atom indices.
+
+From the layers the tables of geometryNaDist.py and
+pymatgen_Na_bond_analyzer.py are built: the pairs of laterally closest atoms
+of consecutive layers, the middle layer with the atoms of the layers
+symmetric around it, and the shells of symmetric layers. Everything is a
+sort or a cell list search between two layers, with no loop over atoms.
+
+Usage: slabLayers.py [-i <CONTCAR>] [-e <element>] [-t <tolerance in Å>] [-a <axis>]'''
+
+import sys, getopt
+import numpy as np
+from periodicDistance import NeighbourPairs, PlaneSpacings
+from poscarReader import ReadPOSCAR, SpeciesIndices
+
+DEFAULT_TOLERANCE = 0.6
+
+def Heights ( frac, lattice, axis=2 ):
+    '''Height of each atom along the surface normal in Å, starting at the
+    largest gap along axis (the vacuum)'''
+    coordinate = frac[:, axis] - np.floor( frac[:, axis] )
+    order = np.argsort( coordinate )
+    gaps = np.diff( np.concatenate( (coordinate[order], [coordinate[order[0]] + 1]) ) )
+    bottom = coordinate[order[(np.argmax( gaps ) + 1) % len( order )]]
+    return ((coordinate - bottom) % 1.0)*PlaneSpacings( lattice )[axis]
+
+def DetectLayers ( frac, lattice, atoms, tolerance=DEFAULT_TOLERANCE, axis=2 ):
+    '''Layers of atoms (0-based indices), bottom to top'''
+    atoms = np.asarray( atoms, dtype=int )
+    heights = Heights( frac[atoms], lattice, axis )
+    order = np.argsort( heights, kind='stable' )
+    splits = np.flatnonzero( np.diff( heights[order] ) > tolerance ) + 1
+    return [np.sort( layer ) for layer in np.split( atoms[order], splits )]
+
+def ClosestInLayer ( frac, lattice, atoms, layer, axis=2 ):
+    '''Atom of layer laterally closest to each of atoms (minimum image, on
+    the surface). The cartesian positions are projected onto the surface
+    plane, so that the in-plane component of a tilted normal lattice vector
+    is kept, and searched with the cell list of periodicDistance.NeighbourPairs
+    in a cell made of the two surface vectors and the unit normal, from a
+    cutoff of about the lateral spacing of layer, doubled until every atom
+    has a candidate, so the cost grows linearly with the number of atoms.'''
+    atoms = np.asarray( atoms, dtype=int )
+    layer = np.asarray( layer, dtype=int )
+    lattice = np.asarray( lattice, dtype=float )
+    surface = [vector for vector in range( 3 ) if vector != axis]
+    normal = np.cross( lattice[surface[0]], lattice[surface[1]] )
+    area = np.linalg.norm( normal )
+    normal /= area
+    positions = np.asarray( frac, dtype=float ) @ lattice
+    positions -= np.outer( positions @ normal, normal )
+    subset = np.union1d( atoms, layer )
+    cutoff = 1.5*np.sqrt( area/len( layer ) )
+    while True:
+        # the normal is long enough for its images to be out of reach
+        flat_lattice = lattice.copy()
+        flat_lattice[axis] = 4.0*cutoff*normal
+        flat = positions @ np.linalg.inv( flat_lattice )
+        i, j, shift, vectors, distances = NeighbourPairs( flat, flat_lattice, cutoff, subset )
+        # NeighbourPairs gives each pair once (i < j): look at both directions
+        source = np.concatenate( (i, j) )
+        target = np.concatenate( (j, i) )
+        distances = np.concatenate( (distances, distances) )
+        wanted = np.isin( source, atoms ) & np.isin( target, layer )
+        source, target, distances = source[wanted], target[wanted], distances[wanted]
+        # closest first, the lowest index among equally close atoms
+        order = np.lexsort( (target, distances, source) )
+        found, first = np.unique( source[order], return_index=True )
+        if np.isin( atoms, found ).all():
+            return target[order[first]][np.searchsorted( found, atoms )]
+        cutoff *= 2.0
+
+def NeighbourTable ( layers, frac, lattice, axis=2 ):
+    '''Pairs (npairs, 2) joining each atom to the laterally closest atom of
+    the next layer up, in layer order'''
+    pairs = [np.stack( (lower, ClosestInLayer( frac, lattice, lower, upper, axis )), axis=-1 )
+        for lower, upper in zip( layers[:-1], layers[1:] )]
+    return np.concatenate( pairs ) if pairs else np.zeros( (0, 2), dtype=int )
+
+def MiddleTable ( layers, frac, lattice, axis=2 ):
+    '''Atoms of the middle layer and, for each layer below it (bottom up) and
+    then each layer above it (top down), the atoms laterally closest to each
+    middle atom, so that rows i and i + len/2 are at the same depth. An even
+    number of layers has no middle layer and raises ValueError.'''
+    if len( layers ) % 2 == 0:
+        raise ValueError( "{} layers: an even number of layers has no middle layer".format( len( layers ) ) )
+    middle = layers[len( layers )//2]
+    below = layers[:len( layers )//2]
+    above = layers[len( layers )//2 + 1:][::-1]
+    rows = [ClosestInLayer( frac, lattice, middle, layer, axis ) for layer in below + above]
+    return middle, np.array( rows, dtype=int ).reshape( -1, len( middle ) )
+
+def SymmetricShells ( layers ):
+    '''Atoms of each pair of layers symmetric around the middle, from the
+    surfaces inwards; the middle layer of an odd slab is a shell by itself'''
+    shells = [np.concatenate( (layers[k], layers[-1 - k]) ) for k in range( len( layers )//2 )]
+    if len( layers ) % 2:
+        shells.append( layers[len( layers )//2] )
+    return shells
+
+def SlabLayers ( poscar_path, element, tolerance=DEFAULT_TOLERANCE, axis=2 ):
+    '''Layers of element in the POSCAR/CONTCAR, with the structure read'''
+    poscar = ReadPOSCAR( poscar_path )
+    layers = DetectLayers( poscar['frac'], poscar['lattice'], SpeciesIndices( poscar, element ), tolerance, axis )
+    return layers, poscar
+
+def main( argv ):
+    usage = "slabLayers.py -i <CONTCAR> -e <element> -t <tolerance in Å> -a <axis>"
+    try:
+        opts, args = getopt.getopt( argv, "hi:e:t:a:", ["input=", "element=", "tolerance=", "axis="] )
+    except getopt.GetoptError:
+        print( usage )
+        sys.exit(2)
+
+    poscar_path = 'CONTCAR'
+    element = 'Na'
+    tolerance = DEFAULT_TOLERANCE
+    axis = 2
+    for opt, arg in opts:
+        if opt == "-h":
+            print( usage )
+            sys.exit()
+        elif opt in ( "-i", "--input" ):
+            poscar_path = arg
+        elif opt in ( "-e", "--element" ):
+            element = arg
+        elif opt in ( "-t", "--tolerance" ):
+            tolerance = float( arg )
+        elif opt in ( "-a", "--axis" ):
+            axis = int( arg )
+
+    layers, poscar = SlabLayers( poscar_path, element, tolerance, axis )
+    heights = Heights( poscar['frac'], poscar['lattice'], axis )
+    # 1-based indices, as in the VESTA/VASP numbering used by the scripts
+    for number, layer in enumerate( layers ):
+        print( "layer {} ({:.3f} Å): {}".format( number + 1, heights[layer].mean(), " ".join( str( atom + 1 ) for atom in layer ) ) )
+    print( "neighbours: {}".format( (NeighbourTable( layers, poscar['frac'], poscar['lattice'], axis ) + 1).tolist() ) )
+    if len( layers ) % 2:
+        middle, rows = MiddleTable( layers, poscar['frac'], poscar['lattice'], axis )
+        print( "middle: {} {}".format( (middle + 1).tolist(), (rows + 1).tolist() ) )
+    else:
+        print( "middle: none ({} layers)".format( len( layers ) ) )
+    print( "shells: {}".format( [(shell + 1).tolist() for shell in SymmetricShells( layers )] ) )
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
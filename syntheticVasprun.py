@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Writes a synthetic vasprun.xml with the blocks read by the PDOS scripts
+
+The file has the <incar>, <parameters> (ISPIN, NEDOS, LNONCOLLINEAR),
+<atominfo> and <dos> (efermi, <total> and <partial>) elements laid out and
+formatted as VASP does. The partial DOS of each ion is a random sum of
+Gaussian bands, so it looks like (and compresses like) a real one. The
+number of ions can be derived from a target file size, up to several GB;
+the rows are formatted block-wise so writing is limited by the disk.
+
+Usage: syntheticVasprun.py [-o <vasprun.xml>] [-n <ions>] [-s <ISPIN>] [-e <NEDOS>]
+                           [-f <s|spd|lm|lmf>] [-m <target size in MB>] [-c] [-r <seed>]
+    -c writes a non-collinear run (ISPIN=1, 4 spin components)'''
+
+import sys, getopt
+import numpy as np
+
+FIELDS = {
+    's': ['s'],
+    'spd': ['s', 'p', 'd'],
+    'lm': ['s', 'py', 'pz', 'px', 'dxy', 'dyz', 'dz2', 'dxz', 'dx2'],
+    # VASP 5.4.4 and later
+    'lm544': ['s', 'py', 'pz', 'px', 'dxy', 'dyz', 'dz2', 'dxz', 'x2-y2'],
+    'lmf': ['s', 'py', 'pz', 'px', 'dxy', 'dyz', 'dz2', 'dxz', 'dx2',
+            'fy3x2', 'fxyz', 'fyz2', 'fz3', 'fxz2', 'fzx2', 'fx3']
+}
+EMIN = -60.0
+EMAX = 20.0
+EFERMI = 1.2345
+# Ions written per call of the row formatter
+IONS_PER_BLOCK = 4
+
+def RowFormat ( ncols, indent ):
+    return ' '*indent + '<r>' + ' %9.4f'*ncols + ' </r>\n'
+
+def RowSize ( ncols, indent ):
+    return len( RowFormat( ncols, indent ) % tuple( np.zeros( ncols ) ) )
+
+def IonsForSize ( size_mb, spins, nedos, fields='lm' ):
+    '''Number of ions that brings the <partial> block close to size_mb'''
+    row_size = RowSize( len( FIELDS[fields] ) + 1, 8 )
+    return max( 1, int( size_mb*2**20/(row_size*spins*nedos) ) )
+
+def SyntheticPDOS ( rng, energy, ions, spins, ncols ):
+    '''Random Gaussian bands below and above the Fermi level, with dimensions
+    (ions, spins, nedos, ncols)'''
+    nbands = 12
+    centres = rng.uniform( EMIN + 5.0, EMAX - 2.0, size=(ions, spins, 1, ncols, nbands) )
+    widths = rng.uniform( 0.2, 2.0, size=(ions, spins, 1, ncols, nbands) )
+    heights = rng.exponential( 0.05, size=(ions, spins, 1, ncols, nbands) )
+    delta = energy[np.newaxis, np.newaxis, :, np.newaxis, np.newaxis] - centres
+    return (heights*np.exp( -0.5*(delta/widths)**2 )).sum( axis=-1 )
+
+def WriteSyntheticVasprun ( output_path, ions, ispin=2, nedos=3001, fields='lm', noncollinear=False, seed=0 ):
+    rng = np.random.default_rng( seed )
+    names = FIELDS[fields]
+    if noncollinear:
+        ispin = 1
+    spins = 4 if noncollinear else ispin
+    energy = np.linspace( EMIN, EMAX, nedos )
+    row_format = RowFormat( len( names ) + 1, 8 )
+
+    with open( output_path, 'w', buffering=1 << 22 ) as output:
+        output.write( '<?xml version="1.0" encoding="ISO-8859-1"?>\n<modeling>\n' )
+        output.write( ' <generator>\n  <i name="program" type="string">vasp </i>\n </generator>\n' )
+        output.write( ' <incar>\n  <i type="int" name="ISPIN">    {}</i>\n  <i type="int" name="NEDOS">   {}</i>\n </incar>\n'.format( ispin, nedos ) )
+        output.write( ' <parameters>\n  <separator name="electronic">\n' )
+        output.write( '   <i type="int" name="NELECT">  {}</i>\n'.format( 8*ions ) )
+        output.write( '   <i type="int" name="NEDOS">   {}</i>\n'.format( nedos ) )
+        output.write( '   <separator name="electronic spin">\n' )
+        output.write( '    <i type="int" name="ISPIN">    {}</i>\n'.format( ispin ) )
+        output.write( '    <i type="logical" name="LNONCOLLINEAR"> {}  </i>\n'.format( 'T' if noncollinear else 'F' ) )
+        output.write( '   </separator>\n  </separator>\n </parameters>\n' )
+        output.write( ' <atominfo>\n  <atoms>     {} </atoms>\n  <types>       1 </types>\n </atominfo>\n'.format( ions ) )
+        output.write( ' <calculation>\n  <dos>\n   <i name="efermi">      {:.8f} </i>\n'.format( EFERMI ) )
+
+        output.write( '   <total>\n    <array>\n     <dimension dim="1">gridpoints</dimension>\n' )
+        output.write( '     <dimension dim="2">spin</dimension>\n     <field>energy</field>\n' )
+        output.write( '     <field>total</field>\n     <field>integrated</field>\n     <set>\n' )
+        total = SyntheticPDOS( rng, energy, 1, spins, 1 )[0, ..., 0]*ions
+        for spin in range( spins ):
+            output.write( '      <set comment="spin {}">\n'.format( spin + 1 ) )
+            columns = np.stack( (energy, total[spin], np.cumsum( total[spin] )*(energy[1] - energy[0])), axis=-1 )
+            output.write( (RowFormat( 3, 7 )*nedos) % tuple( columns.ravel().tolist() ) )
+            output.write( '      </set>\n' )
+        output.write( '     </set>\n    </array>\n   </total>\n' )
+
+        output.write( '   <partial>\n    <array>\n     <dimension dim="1">gridpoints</dimension>\n' )
+        output.write( '     <dimension dim="2">spin</dimension>\n     <dimension dim="3">ion</dimension>\n' )
+        output.write( '     <field>energy</field>\n' )
+        for name in names:
+            output.write( '     <field>{}</field>\n'.format( name ) )
+        output.write( '     <set>\n' )
+        for first in range( 0, ions, IONS_PER_BLOCK ):
+            block = SyntheticPDOS( rng, energy, min( IONS_PER_BLOCK, ions - first ), spins, len( names ) )
+            for ion in range( block.shape[0] ):
+                output.write( '      <set comment="ion {}">\n'.format( first + ion + 1 ) )
+                for spin in range( spins ):
+                    columns = np.concatenate( (np.broadcast_to( energy[:, np.newaxis], (nedos, 1) ), block[ion, spin]), axis=-1 )
+                    output.write( '       <set comment="spin {}">\n'.format( spin + 1 ) )
+                    output.write( (row_format*nedos) % tuple( columns.ravel().tolist() ) )
+                    output.write( '       </set>\n' )
+                output.write( '      </set>\n' )
+        output.write( '     </set>\n    </array>\n   </partial>\n  </dos>\n </calculation>\n</modeling>\n' )
+
+def main( argv ):
+    usage = "syntheticVasprun.py -o <vasprun.xml> -n <ions> -s <ISPIN> -e <NEDOS> -f <s|spd|lm|lmf> -m <size in MB> -c -r <seed>"
+    try:
+        opts, args = getopt.getopt( argv, "ho:n:s:e:f:m:cr:",
+            ["out=", "ions=", "ispin=", "nedos=", "fields=", "size=", "noncollinear", "seed="] )
+    except getopt.GetoptError:
+        print( usage )
+        sys.exit(2)
+
+    output_path = 'vasprun.xml'
+    ions = 86
+    ispin = 2
+    nedos = 3001
+    fields = 'lm'
+    size_mb = None
+    noncollinear = False
+    seed = 0
+    for opt, arg in opts:
+        if opt == "-h":
+            print( usage )
+            sys.exit()
+        elif opt in ( "-o", "--out" ):
+            output_path = arg
+        elif opt in ( "-n", "--ions" ):
+            ions = int( arg )
+        elif opt in ( "-s", "--ispin" ):
+            ispin = int( arg )
+        elif opt in ( "-e", "--nedos" ):
+            nedos = int( arg )
+        elif opt in ( "-f", "--fields" ):
+            if arg not in FIELDS:
+                print( "-f should be one of {}".format( ", ".join( FIELDS ) ) )
+                sys.exit(2)
+            fields = arg
+        elif opt in ( "-m", "--size" ):
+            size_mb = float( arg )
+        elif opt in ( "-c", "--noncollinear" ):
+            noncollinear = True
+        elif opt in ( "-r", "--seed" ):
+            seed = int( arg )
+
+    if size_mb is not None:
+        ions = IonsForSize( size_mb, 4 if noncollinear else ispin, nedos, fields )
+    print( "writing {} ions, ISPIN={}, NEDOS={}, fields {} on file {}".format( ions, 1 if noncollinear else ispin, nedos, fields, output_path ) )
+    WriteSyntheticVasprun( output_path, ions, ispin, nedos, fields, noncollinear, seed )
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Streaming reader for the vasprun.xml file written by VASP
+
+The file is read in a single forward pass with ElementTree's iterparse.
+Every element is cleared as soon as it is closed, so the memory used is
+bounded by the data kept (the selected ions of the <partial> block) and not
+by the size of the vasprun.xml file.'''
+
+import re
+import xml.etree.ElementTree as et
+import numpy as np
+from instrumentation import Progress, Stage
+
+# VASP drops the separating blank when a negative number fills its field
+# ("0.1234-0.5678") and writes "*****" when a value overflows its field
+RUN_TOGETHER = re.compile( r'(?<=[0-9.])-' )
+OVERFLOW = re.compile( r'\*+' )
+
+def ExpandIonList ( ion_list ):
+    '''A sequence of atoms can be evaluated by declaring the first and last atom.
+    A list of atoms in any order can be evaluated by explicitly declaring each one.
+    Returns the explicit 1-based ion list.'''
+    ion_list = np.asarray( ion_list, dtype=int )
+    if len( ion_list ) == 2:
+        ion_list = np.arange( ion_list[0], ion_list[1] + 1 )
+    return ion_list
+
+def CheckIons ( ion_list, natoms ):
+    '''Raises ValueError unless every ion of ion_list (1-based) is one of the
+    natoms of the run'''
+    ion_list = np.asarray( ion_list, dtype=int )
+    outside = ion_list[(ion_list < 1) | (ion_list > natoms)]
+    if len( outside ):
+        raise ValueError( "ions {} are not between 1 and {}, the number of atoms".format( outside.tolist(), natoms ) )
+
+def ParseRows ( rows, ncols, out=None ):
+    '''Converts the text of the <r> rows of a <set> with a single vectorized
+    call, into out (an np.array with dimensions (len( rows ), ncols)) if given.
+    Overflowed "*****" fields become NaN.'''
+    with Stage( 'row_parsing', items=len( rows ) ):
+        text = ' ' + ' '.join( rows )
+        if '*' in text:
+            text = OVERFLOW.sub( ' nan ', text )
+        # Cheap test first: every '-' is either a sign after a blank or an exponent
+        if text.count( '-' ) != text.count( ' -' ) + text.count( 'E-' ) + text.count( 'e-' ):
+            text = RUN_TOGETHER.sub( ' -', text )
+        values = np.fromstring( text, sep=' ' )
+    if values.size != len( rows )*ncols:
+        raise ValueError( "expected {} rows of {} values, read {} values".format( len( rows ), ncols, values.size ) )
+    if out is None:
+        return values.reshape( len( rows ), ncols )
+    out[...] = values.reshape( len( rows ), ncols )
+    return out
+
+def ReadPartialDOS ( vasprun_path, ion_list=None, verbose=True, allocate=np.empty ):
+    '''Extracts the partial (site and orbital projected) DOS of the ions in
+    ion_list (1-based, already expanded) from vasprun_path.
+    If ion_list is None, every ion is extracted; an ion outside the atoms of
+    the run raises ValueError.
+    allocate is called with the shape of pdos_raw, known only once the
+    <partial> headers are read, and returns the array filled set by set, e.g.
+    an np.lib.format.open_memmap to stream the tensor to disk.
+
+    Returns a dict with:
+        * ispin, an int
+        * nedos, an int
+        * efermi, a float
+        * fields, the column names of the <partial> block ('energy', 's', ...)
+        * pdos_raw, an np.array with dimensions (ion, spin, nedos, fields)
+          ordered as ion_list, where spin has ISPIN components, or 4
+          (total, mx, my, mz) in a non-collinear run'''
+    ispin = nedos = efermi = natoms = noncollinear = None
+    fields = []
+    pdos_raw = None
+    # 0-based ion -> positions in pdos_raw (an ion can be declared twice)
+    wanted = {}
+
+    path = []
+    partial = -1
+    ion = spin = -1
+    rows = []
+    with Stage( 'xml_read' ) as stage:
+        for event, elem in et.iterparse( vasprun_path, events=('start', 'end') ):
+            if event == 'start':
+                path.append( elem.tag )
+                if elem.tag == 'partial':
+                    partial = len( path ) - 1
+                elif elem.tag == 'set' and partial >= 0:
+                    depth = len( path ) - 1 - partial
+                    if depth == 2:
+                        # partial/array/set: the <field> headers were already read
+                        if ion_list is None:
+                            ion_list = np.arange( 1, natoms + 1 )
+                        CheckIons( ion_list, natoms )
+                        for position, i in enumerate( ion_list ):
+                            wanted.setdefault( int( i ) - 1, [] ).append( position )
+                        spins = 4 if noncollinear else ispin
+                        pdos_raw = allocate( (len( ion_list ), spins, nedos, len( fields )) )
+                        progress = Progress( "extracting ions", len( wanted ), verbose )
+                    elif depth == 3:
+                        ion += 1
+                        spin = -1
+                    elif depth == 4:
+                        spin += 1
+                continue
+
+            path.pop()
+            tag = elem.tag
+            if tag == 'i':
+                name = elem.get( 'name' )
+                if name == 'ISPIN' and ispin is None:
+                    ispin = int( elem.text )
+                elif name == 'NEDOS' and nedos is None:
+                    nedos = int( elem.text )
+                elif name == 'efermi' and efermi is None:
+                    efermi = float( elem.text )
+                elif name == 'LNONCOLLINEAR' and noncollinear is None:
+                    noncollinear = elem.text.strip() == 'T'
+            elif tag == 'atoms' and natoms is None:
+                natoms = int( elem.text )
+            elif partial >= 0:
+                if tag == 'r':
+                    if ion in wanted:
+                        rows.append( elem.text )
+                elif tag == 'field':
+                    fields.append( elem.text.strip() )
+                elif tag == 'set' and len( path ) - partial == 4 and ion in wanted:
+                    # End of a spin <set>: all its rows are parsed at once
+                    first = wanted[ion][0]
+                    ParseRows( rows, len( fields ), pdos_raw[first, spin] )
+                    for position in wanted[ion][1:]:
+                        pdos_raw[position, spin] = pdos_raw[first, spin]
+                    rows = []
+                elif tag == 'set' and len( path ) - partial == 3 and ion in wanted:
+                    progress.update()
+                    stage.items += pdos_raw.shape[1]*nedos
+                elif tag == 'partial':
+                    break
+            elem.clear()
+
+    return {
+        'ispin': ispin,
+        'nedos': nedos,
+        'efermi': efermi,
+        'fields': fields,
+        'pdos_raw': pdos_raw
+    }
+
+def ReadEigenvalues ( vasprun_path ):
+    '''Extracts the Kohn-Sham eigenvalues of the final step of vasprun_path,
+    stopping before the <projected> block, which is never parsed.
+
+    Returns a dict with:
+        * ispin, an int
+        * efermi, a float
+        * kpoints, an np.array with dimensions (kpoint, 3), fractional
+        * eigenvalues and occupations, np.arrays with dimensions (spin,
+          kpoint, band), where spin has ISPIN components (1 in a
+          non-collinear run)'''
+    ispin = nbands = efermi = noncollinear = None
+    kpoint_rows = []
+    kpoints = eigenvalues = None
+
+    path = []
+    eigen = -1
+    in_kpointlist = False
+    spin = kpoint = -1
+    rows = []
+    with Stage( 'xml_read' ):
+        for event, elem in et.iterparse( vasprun_path, events=('start', 'end') ):
+            if event == 'start':
+                path.append( elem.tag )
+                if elem.tag == 'projected':
+                    break
+                elif elem.tag == 'eigenvalues':
+                    # the last ionic step is the one holding the eigenvalues
+                    eigen = len( path ) - 1
+                    spin = -1
+                elif elem.tag == 'varray' and elem.get( 'name' ) == 'kpointlist' and not kpoint_rows:
+                    in_kpointlist = True
+                elif elem.tag == 'set' and eigen >= 0:
+                    depth = len( path ) - 1 - eigen
+                    if depth == 2:
+                        values = np.empty( (1 if noncollinear else ispin, len( kpoints ), nbands, 2) )
+                    elif depth == 3:
+                        spin += 1
+                        kpoint = -1
+                    elif depth == 4:
+                        kpoint += 1
+                continue
+
+            path.pop()
+            tag = elem.tag
+            if tag == 'i':
+                name = elem.get( 'name' )
+                if name == 'ISPIN' and ispin is None:
+                    ispin = int( elem.text )
+                elif name == 'NBANDS' and nbands is None:
+                    nbands = int( elem.text )
+                elif name == 'efermi':
+                    efermi = float( elem.text )
+                elif name == 'LNONCOLLINEAR' and noncollinear is None:
+                    noncollinear = elem.text.strip() == 'T'
+            elif in_kpointlist:
+                if tag == 'v':
+                    kpoint_rows.append( elem.text )
+                elif tag == 'varray':
+                    in_kpointlist = False
+                    kpoints = ParseRows( kpoint_rows, 3 )
+            elif eigen >= 0:
+                if tag == 'r':
+                    rows.append( elem.text )
+                elif tag == 'set' and len( path ) - eigen == 4:
+                    # End of a k-point <set>: energy and occupation of each band
+                    ParseRows( rows, 2, values[spin, kpoint] )
+                    rows = []
+                elif tag == 'eigenvalues':
+                    eigen = -1
+                    eigenvalues = values
+            elem.clear()
+
+    if eigenvalues is None:
+        raise ValueError( "{} has no <eigenvalues> block".format( vasprun_path ) )
+    return {
+        'ispin': ispin,
+        'efermi': efermi,
+        'kpoints': kpoints,
+        'eigenvalues': eigenvalues[..., 0],
+        'occupations': eigenvalues[..., 1]
+    }
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+'''Alexandre Olivieri (olivieri.alexandre0@gmail.com)
+
+Streaming XDATCAR reader
+
+IterFrames reads the trajectory in chunks of a fixed number of frames, so
+the memory used does not depend on the length of the run. Frames outside
+the start/stop window or between strides are skipped without converting
+their lines. Both the constant cell layout (one header) and the variable
+cell one (a header before each frame, ISIF=3 runs) are read; the positions
+are returned as fractional coordinates, as in poscarReader.'''
+
+import itertools
+import numpy as np
+from poscarReader import ReadHeader
+
+# Bytes read at a time when counting frames
+COUNT_BLOCK = 1 << 24
+CONFIGURATION = b'configuration='
+
+def CountFrames ( xdatcar_path ):
+    '''Number of frames, counted without parsing the file'''
+    frames = 0
+    tail = b''
+    with open( xdatcar_path, 'rb' ) as xdatcar:
+        for block in iter( lambda: xdatcar.read( COUNT_BLOCK ), b'' ):
+            block = tail + block
+            frames += block.count( CONFIGURATION )
+            # Keep a partial marker for the next block, never a whole one
+            tail = block[-len( CONFIGURATION ) + 1:]
+    return frames
+
+def ReadXDATCARHeader ( xdatcar_path ):
+    '''Header of the first frame (see poscarReader.ReadHeader)'''
+    with open( xdatcar_path ) as xdatcar:
+        return ReadHeader( xdatcar )
+
+def IterFrames ( xdatcar_path, chunk=1000, start=0, stop=None, stride=1 ):
+    '''Yields dicts with, for up to chunk frames,
+        frames, np.array with the 0-based frame indices
+        frac, np.array (frames, natoms, 3) with the fractional positions
+        lattice, np.array (frames, 3, 3) in Å
+    for the frames start, start + stride, ... before stop.'''
+    if stride < 1 or chunk < 1:
+        raise ValueError( "chunk and stride should be positive" )
+    with open( xdatcar_path ) as xdatcar:
+        header = ReadHeader( xdatcar )
+        natoms = header['counts'].sum()
+        frames, lines, lattices, factors = [], [], [], []
+        for frame in itertools.count():
+            if stop is not None and frame >= stop:
+                break
+            line = xdatcar.readline()
+            if not line:
+                break
+            if 'configuration' not in line:
+                # Variable cell: a new header before the configuration line
+                header = ReadHeader( xdatcar, line )
+                line = xdatcar.readline()
+            wanted = frame >= start and (frame - start) % stride == 0
+            if not wanted:
+                for i in range( natoms ):
+                    xdatcar.readline()
+                continue
+
+            block = [xdatcar.readline() for i in range( natoms )]
+            if not block[-1]:
+                raise ValueError( "{} ends in the middle of frame {}".format( xdatcar_path, frame + 1 ) )
+            frames.append( frame )
+            lines.extend( block )
+            lattices.append( header['lattice'] )
+            # Cartesian frames are scaled and converted per chunk
+            factors.append( np.broadcast_to( header['factor'], 3 ) if line.lstrip()[:1] in ( 'C', 'c', 'K', 'k' ) else None )
+            if len( frames ) == chunk:
+                yield ChunkArrays( frames, lines, lattices, factors, natoms )
+                frames, lines, lattices, factors = [], [], [], []
+        if frames:
+            yield ChunkArrays( frames, lines, lattices, factors, natoms )
+
+def ChunkArrays ( frames, lines, lattices, factors, natoms ):
+    frac = np.fromstring( ' '.join( lines ), sep=' ' )
+    if frac.size != 3*natoms*len( frames ):
+        raise ValueError( "expected 3 coordinates for each of the {} atoms".format( natoms ) )
+    frac = frac.reshape( len( frames ), natoms, 3 )
+    lattices = np.array( lattices )
+    cartesian = [index for index, factor in enumerate( factors ) if factor is not None]
+    if cartesian:
+        scaled = frac[cartesian]*np.array( [factors[index] for index in cartesian] )[:, np.newaxis, :]
+        frac[cartesian] = scaled @ np.linalg.inv( lattices[cartesian] )
+    return {
+        'frames': np.array( frames ),
+        'frac': frac,
+        'lattice': lattices
+    }